@@ -0,0 +1,264 @@
+"""
+Embeddings del Workshop RAG
+Interfaz de embeddings común a todos los módulos y cache persistente
+compartida por indexación y queries
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings en SQLite
+    Clave: (modelo de embeddings, sha256 del texto). Eviction LRU por tamaño
+    """
+
+    # Límite de variables por sentencia en SQLite
+    _SQL_BATCH = 500
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self.conn.commit()
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Buscar embeddings en cache (None para los que no están)"""
+        hashes = [self.text_hash(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self.lock:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), self._SQL_BATCH):
+                batch = unique[start:start + self._SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+            # Actualizar recencia para la eviction LRU
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self.conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[Any]):
+        """Guardar embeddings (float32) y aplicar eviction si se supera el tamaño"""
+        now = time.time()
+        rows = [
+            (model, self.text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._entries += len(rows)
+            if self._entries > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Eliminar las entradas menos usadas hasta quedar en el 90% de la capacidad"""
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._entries - int(self.max_entries * 0.9)
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+            self._entries -= excess
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.commit()
+            self._entries = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class Embedder:
+    """
+    Interfaz común de embeddings para todos los módulos
+    - Compatible con Chroma (__call__(input)) y LangChain (embed_documents / embed_query)
+    - Lotes de batch_size textos, hasta `concurrency` lotes en paralelo
+    - Cache persistente opcional: solo se embeben los textos que faltan
+    - dimensions: embeddings Matryoshka recortados (primeras N dimensiones
+      renormalizadas); la cache guarda siempre el vector completo
+    Los backends implementan _embed_batch
+    """
+
+    def __init__(self, model: str, batch_size: int = 100, concurrency: int = 1,
+                 cache: Optional[EmbeddingCache] = None, dimensions: Optional[int] = None):
+        self.model = model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.cache = cache
+        self.dimensions = dimensions
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.truncate(self.embed_full(list(input))).tolist()
+
+    def embed_full(self, texts: List[str]) -> np.ndarray:
+        """Embeddings con todas las dimensiones del modelo, matriz (n, dim)"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.cache is None:
+            return np.vstack(self._embed_unique(texts))
+
+        vectors = self.cache.get_many(self.model, texts)
+
+        # Textos únicos que no están en cache
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            computed = dict(zip(missing, self._embed_unique(missing)))
+            self.cache.put_many(self.model, missing, list(computed.values()))
+            vectors = [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+
+        return np.vstack(vectors)
+
+    def truncate(self, vectors: np.ndarray) -> np.ndarray:
+        """Recorte Matryoshka: primeras `dimensions` dimensiones con norma 1"""
+        if not self.dimensions or vectors.shape[1] <= self.dimensions:
+            return vectors
+        truncated = vectors[:, :self.dimensions]
+        norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+        return truncated / np.where(norms == 0, 1, norms)
+
+    def _embed_unique(self, texts: List[str]) -> List[np.ndarray]:
+        """Embeber en lotes, concurrentes si concurrency > 1 (mantiene el orden)"""
+        batches = [texts[start:start + self.batch_size]
+                   for start in range(0, len(texts), self.batch_size)]
+        if self.concurrency > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+        else:
+            results = [self._embed_batch(batch) for batch in batches]
+        return [np.asarray(vector, dtype=np.float32) for batch in results for vector in batch]
+
+    # API estilo LangChain
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self([text])[0]
+
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings con la API de OpenAI"""
+
+    def __init__(self, client, model: str, **kwargs):
+        super().__init__(model, **kwargs)
+        self.client = client
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in response.data]
+
+
+class HashEmbedder(Embedder):
+    """
+    Embeddings locales y deterministas (hashing de palabras y bigramas)
+    Sin red ni coste: para tests offline y demos
+    """
+
+    _WORD = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 256, **kwargs):
+        super().__init__(f"local-hash-{dim}", **kwargs)
+        self.dim = dim
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = self._WORD.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors.tolist()
+
+
+def create_embedder(params: Dict[str, Any], model: str, client=None,
+                    cache: Optional[EmbeddingCache] = None) -> Embedder:
+    """Crear el embedder configurado en embedding_params"""
+    options = {
+        "batch_size": params["batch_size"],
+        "concurrency": params["concurrency"],
+        "cache": cache,
+        "dimensions": params["dimensions"]
+    }
+    backend = params["backend"]
+    if backend == "openai":
+        return OpenAIEmbedder(client, model, **options)
+    if backend == "hash":
+        return HashEmbedder(dim=params["hash_dim"], **options)
+    raise ValueError(f"Backend de embeddings no soportado: {backend}")
@@ -0,0 +1,165 @@
+"""
+Índice léxico del Workshop RAG
+Índice invertido BM25 en memoria y fusión de rankings (RRF) para búsqueda híbrida
+"""
+
+import re
+import math
+import unicodedata
+from array import array
+from collections import Counter
+from typing import List, Dict, Optional, Any, Iterable, Tuple
+
+import numpy as np
+
+
+class BM25Index:
+    """
+    Índice invertido con scoring BM25 (Okapi)
+    - Tokens que conservan códigos y cifras: "T008", "OAuth", "2.0", "40€"
+    - Postings compactos: por término, arrays int32 de filas y frecuencias
+      (array.array, sin un objeto Python por posting); se leen como vistas NumPy
+    - Borrado lógico por fila; se compacta cuando los borrados superan a los vivos
+    """
+
+    # Palabra con separadores internos (2.0, e-mail, 10/12) y sufijo de moneda o %
+    _TOKEN = re.compile(r"\w+(?:[.,/\-]\w+)*[€$£%]?")
+    _SUFFIXES = "€$£%"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._ids: List[Optional[str]] = []  # fila -> chunk ID (None si borrado)
+        self._row_of: Dict[str, int] = {}
+        self._lengths = array("i")
+        self._alive = array("b")
+        self._total_length = 0
+        self._length_norm = None  # k1 * (1 - b + b * len / avgdl), se recalcula al cambiar
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Minúsculas sin acentos; "40€" genera también "40" """
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        tokens = cls._TOKEN.findall(text)
+        return tokens + [token[:-1] for token in tokens
+                         if len(token) > 1 and token[-1] in cls._SUFFIXES]
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._row_of
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Añadir documentos (un ID ya indexado no se re-indexa: mismo ID = mismo texto)"""
+        for chunk_id, text in zip(ids, texts):
+            if chunk_id in self._row_of:
+                continue
+            row = len(self._ids)
+            tokens = self.tokenize(text)
+            for term, tf in Counter(tokens).items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("i"), array("i"))
+                postings[0].append(row)
+                postings[1].append(tf)
+            self._ids.append(chunk_id)
+            self._row_of[chunk_id] = row
+            self._lengths.append(len(tokens))
+            self._alive.append(1)
+            self._total_length += len(tokens)
+        self._length_norm = None
+
+    def remove(self, ids: Iterable[str]):
+        for chunk_id in ids:
+            row = self._row_of.pop(chunk_id, None)
+            if row is None:
+                continue
+            self._ids[row] = None
+            self._alive[row] = 0
+            self._total_length -= self._lengths[row]
+        self._length_norm = None
+        if len(self._ids) - len(self._row_of) > len(self._row_of):
+            self._compact()
+
+    def clear(self):
+        self.__init__(self.k1, self.b)
+
+    def _compact(self):
+        """Eliminar las filas borradas de los postings y renumerar"""
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        new_row = np.cumsum(alive) - 1
+        postings = {}
+        for term, (rows, tfs) in self._postings.items():
+            rows = np.frombuffer(rows, dtype=np.int32)
+            keep = alive[rows]
+            if keep.any():
+                postings[term] = (array("i", new_row[rows[keep]].astype(np.int32).tobytes()),
+                                  array("i", np.frombuffer(tfs, dtype=np.int32)[keep].tobytes()))
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)[alive]
+
+        self._postings = postings
+        self._ids = [chunk_id for chunk_id in self._ids if chunk_id is not None]
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._lengths = array("i", lengths.tobytes())
+        self._alive = array("b", b"\x01" * len(self._ids))
+        self._length_norm = None
+
+    def _norms(self) -> np.ndarray:
+        if self._length_norm is None:
+            lengths = np.frombuffer(self._lengths, dtype=np.int32).astype(np.float32)
+            avgdl = self._total_length / len(self) if len(self) else 1.0
+            self._length_norm = self.k1 * (1 - self.b + self.b * lengths / max(avgdl, 1e-9))
+        return self._length_norm
+
+    def search(self, query: str, k: int) -> Tuple[List[str], List[float]]:
+        """Top-k por BM25: (IDs, scores) ordenados; solo documentos con algún término"""
+        terms = set(self.tokenize(query))
+        if not terms or not len(self):
+            return [], []
+
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        norms = self._norms()
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            rows = np.frombuffer(postings[0], dtype=np.int32)
+            keep = alive[rows]
+            rows = rows[keep]
+            if not len(rows):
+                continue
+            tf = np.frombuffer(postings[1], dtype=np.int32)[keep].astype(np.float32)
+            idf = math.log(1 + (len(self) - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norms[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [self._ids[row] for row in matched], [float(scores[row]) for row in matched]
+
+    def get_stats(self) -> Dict[str, Any]:
+        postings = sum(len(rows) for rows, _ in self._postings.values())
+        return {
+            "documents": len(self),
+            "terms": len(self._postings),
+            "postings": postings,
+            "postings_bytes": postings * 8,
+            "avg_length": self._total_length / len(self) if len(self) else 0.0
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Reciprocal Rank Fusion: score(d) = Σ 1 / (k + rank_i(d)), rank desde 1
+    Combina rankings de escalas distintas (BM25, distancia L2) sin normalizar
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -4,11 +4,14 @@ Extiende el Módulo 1 con optimizaciones de rendimiento
 """
 
 import os
+import re
 import time
 import hashlib
 import json
-from typing import List, Dict, Optional, Any, Tuple
-from collections import OrderedDict
+import zlib
+from typing import List, Dict, Optional, Any, Tuple, Iterator
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 # Deshabilitar telemetría de ChromaDB
@@ -17,6 +20,14 @@ os.environ["ANONYMIZED_TELEMETRY"] = "False"
 from module_1_basics import Module1_BasicRAG
 from shared_config import RAGMasterConfig, Module, measure_performance
 
+# Tokenizer exacto para chunking y estimación de costes (opcional)
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    print("⚠️ tiktoken no instalado. Conteo de tokens aproximado por palabras")
+
 
 class LRUCache:
     """Cache LRU simple para queries"""
@@ -44,6 +55,110 @@ class LRUCache:
         self.cache.clear()
 
 
+class FeatureExtractor:
+    """
+    Etiquetas booleanas de metadatos en una sola pasada por chunk
+    Todas las etiquetas se combinan en un único regex precompilado: cada una es
+    un lookahead opcional con grupo nombrado, así en una misma posición pueden
+    coincidir varias (has_numbers y una etiqueta de importes). El recorrido se
+    corta en cuanto se han encontrado todas
+    Con workers > 1, las listas de al menos min_parallel textos se reparten en
+    un ProcessPoolExecutor (el regex es CPU puro: los hilos no escalan por el GIL)
+    """
+
+    def __init__(self, tags: Dict[str, str], workers: int = 1, min_parallel: int = 5000):
+        self.workers = workers
+        self.min_parallel = min_parallel
+        self.tags = list(tags)
+        # Solo se para en posiciones donde empieza alguna etiqueta
+        any_tag = "|".join(f"(?:{pattern})" for pattern in tags.values())
+        lookaheads = "".join(f"(?:(?=(?P<{name}>{pattern})))?"
+                             for name, pattern in tags.items())
+        self.pattern = re.compile(f"(?=(?:{any_tag})){lookaheads}", re.IGNORECASE)
+
+    def extract(self, text: str) -> Dict[str, bool]:
+        pending = list(self.tags)
+        for match in self.pattern.finditer(text):
+            pending = [name for name in pending if match.group(name) is None]
+            if not pending:
+                break
+        return {name: name not in pending for name in self.tags}
+
+    def extract_many(self, texts: List[str]) -> List[Dict[str, bool]]:
+        if self.workers <= 1 or len(texts) < self.min_parallel:
+            return [self.extract(text) for text in texts]
+
+        # Un bloque contiguo por tarea, varias tareas por worker para repartir carga
+        step = -(-len(texts) // (self.workers * 4))
+        blocks = [texts[start:start + step] for start in range(0, len(texts), step)]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            extracted = executor.map(self._extract_block, blocks)
+            return [features for block in extracted for features in block]
+
+    def _extract_block(self, texts: List[str]) -> List[Dict[str, bool]]:
+        return [self.extract(text) for text in texts]
+
+
+class MinHashDeduplicator:
+    """
+    Detección de chunks casi duplicados con MinHash + LSH (vectorizado con NumPy)
+    Jaccard estimada sobre shingles de caracteres; LSH por bandas para candidatos
+    """
+
+    PRIME = (1 << 31) - 1  # Primo de Mersenne: a*h+b cabe en uint64
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 5, seed: int = 42):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self.PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, self.PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash de num_perm valores"""
+        normalized = " ".join(text.lower().split())
+        k = self.shingle_size
+        shingles = {normalized[i:i + k] for i in range(max(1, len(normalized) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(sh.encode()) for sh in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((np.outer(hashes, self._a) + self._b) % self.PRIME).min(axis=0)
+
+    def find_duplicates(self, texts: List[str]) -> Dict[int, int]:
+        """
+        Mapa {índice_duplicado: índice_conservado}
+        Se conserva siempre la primera aparición
+        """
+        if len(texts) < 2:
+            return {}
+
+        signatures = np.vstack([self.signature(t) for t in texts])
+        canonical = {}
+
+        for band in range(self.bands):
+            band_slice = signatures[:, band * self.rows:(band + 1) * self.rows]
+            buckets = defaultdict(list)
+            for idx, row in enumerate(band_slice):
+                buckets[row.tobytes()].append(idx)
+
+            for members in buckets.values():
+                for j in members[1:]:
+                    if j in canonical:
+                        continue
+                    for i in members:
+                        if i >= j or i in canonical:
+                            continue
+                        # Verificar candidato con la similitud estimada completa
+                        if np.mean(signatures[i] == signatures[j]) >= self.threshold:
+                            canonical[j] = i
+                            break
+
+        return canonical
+
+
 class Module2_OptimizedRAG(Module1_BasicRAG):
     """
     Versión 2: RAG Optimizado con cache, overlap y re-ranking
@@ -57,58 +172,95 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
 
         # Actualizar configuración para Módulo 2
         self.module = Module.OPTIMIZED
-        self.chunk_size = self.config.chunking_params[self.module]["size"]
-        self.chunk_overlap = self.config.chunking_params[self.module]["overlap"]
+        self._apply_chunking_params()
 
         # Cache para queries
         self.query_cache = LRUCache(capacity=50)
-        self.embedding_cache = LRUCache(capacity=200)
+
+        # Tokenizer (carga perezosa) y cache de tokens por párrafo
+        self._encoding = None
+        self.token_cache = LRUCache(capacity=10000)
 
         # Configuración adicional
         self.temperature = 0.3
         self.use_cache = True
         self.use_reranking = True
 
-        # Crear colección para módulo 2
-        collection_name = f"{self.config.COLLECTION_NAME}_module2"
+        # Deduplicación de chunks antes de indexar
+        dedup_params = self.config.ingestion_params["dedup"]
+        self.use_dedup = dedup_params["enabled"]
+        self.deduplicator = MinHashDeduplicator(
+            threshold=dedup_params["threshold"],
+            num_perm=dedup_params["num_perm"],
+            bands=dedup_params["bands"],
+            shingle_size=dedup_params["shingle_size"]
+        )
 
-        # Eliminar colección existente si existe
-        try:
-            self.chroma_client.delete_collection(name=collection_name)
-        except ValueError:
-            pass  # Colección no existe, continuar
+        # Etiquetas de metadatos definidas en configuración
+        ingestion = self.config.ingestion_params
+        self.feature_extractor = FeatureExtractor(ingestion["metadata_tags"],
+                                                  workers=ingestion["feature_workers"],
+                                                  min_parallel=ingestion["feature_parallel_min"])
 
-        # Crear colección nueva
-        self.collection = self.chroma_client.create_collection(
-            name=collection_name
-        )
+        # Crear colección para módulo 2
+        self._setup_collection(f"{self.config.COLLECTION_NAME}_module2")
 
         print(f"✅ Module 2 OptimizedRAG inicializado")
         print(f"   - Cache habilitado: {self.use_cache}")
         print(f"   - Re-ranking habilitado: {self.use_reranking}")
         print(f"   - Chunk overlap: {self.chunk_overlap}")
 
+    def _apply_chunking_params(self):
+        """Cargar los parámetros de chunking del módulo actual (incluida la estrategia)"""
+        params = self.config.chunking_params[self.module]
+        self.chunk_size = params["size"]
+        self.chunk_overlap = params["overlap"]
+        self.chunking_strategy = params["strategy"]
+        self.token_size = params["token_size"]
+        self.token_overlap = params["token_overlap"]
+
+    def _window_bounds(self, text_length: int) -> Iterator[Tuple[int, int]]:
+        """Ventanas (start, end) con overlap, más la ventana final si es necesaria"""
+        # Calcular step size basado en overlap
+        step_size = self.chunk_size - self.chunk_overlap
+
+        for i in range(0, text_length - self.chunk_size + 1, step_size):
+            yield i, i + self.chunk_size
+
+        # Añadir último chunk si es necesario
+        if text_length % step_size > 50:
+            yield max(0, text_length - self.chunk_size), text_length
+
     def create_chunks(self, text: str) -> List[str]:
         """
-        Crear chunks CON overlap (mejora del Módulo 1)
+        Crear chunks según la estrategia configurada del módulo
+        - fixed / recursive: ventanas CON overlap (mejora del Módulo 1)
+        - semantic: cortes donde cae la similitud entre frases adyacentes
+        - adaptive: tamaño de chunk según la densidad del contenido
         """
-        chunks = []
+        if self.chunking_strategy in ("semantic", "adaptive"):
+            if self.chunking_strategy == "semantic":
+                chunks = self.semantic_chunking(text)
+            else:
+                chunks = self.adaptive_chunking(text)
 
-        # Calcular step size basado en overlap
-        step_size = self.chunk_size - self.chunk_overlap
+            self.chunks = chunks
+            print(f"✂️ Creados {len(chunks)} chunks ({self.chunking_strategy}, "
+                  f"máx {self.chunk_size} chars)")
+            if chunks:
+                print(f"   - Promedio: {np.mean([len(c) for c in chunks]):.0f} chars")
+            return chunks
+
+        chunks = []
 
         # Crear chunks con overlap
-        for i in range(0, len(text) - self.chunk_size + 1, step_size):
-            chunk = text[i:i + self.chunk_size]
+        for start, end in self._window_bounds(len(text)):
+            chunk = text[start:end]
 
             # Solo añadir chunks significativos
             if len(chunk.strip()) > 50:
                 chunks.append(chunk)
 
-        # Añadir último chunk si es necesario
-        if len(text) % step_size > 50:
-            chunks.append(text[-(self.chunk_size):])
-
         self.chunks = chunks
 
         print(
@@ -121,10 +273,131 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
 
         return chunks
 
-    def smart_chunking(self, text: str) -> List[Dict[str, Any]]:
+    def semantic_chunking(self, text: str) -> List[str]:
+        """
+        Chunking semántico: embeddings de frases en batch y corte donde la
+        similitud coseno entre frases adyacentes cae por debajo del percentil
+        configurado (o cuando el chunk alcanza chunk_size)
+        """
+        sentences = self._bound_units(split_sentences(text), self.chunk_size)
+        if len(sentences) < 3:
+            return [text.strip()] if len(text.strip()) > 50 else []
+
+        try:
+            embeddings = np.asarray(self._embed_texts(sentences), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Embeddings no disponibles ({e}), usando chunking adaptativo")
+            return self.adaptive_chunking(text)
+
+        # Similitud entre cada frase y la siguiente (vectorizado)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+        similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+        percentile = self.config.chunking_params[self.module].get("breakpoint_percentile", 20)
+        breakpoint = np.percentile(similarities, percentile)
+
+        chunks = []
+        current = [sentences[0]]
+        current_length = len(sentences[0])
+        min_length = self.chunk_size // 4
+
+        for sentence, similarity in zip(sentences[1:], similarities):
+            topic_shift = similarity < breakpoint and current_length >= min_length
+            too_long = current_length + len(sentence) + 1 > self.chunk_size
+            if topic_shift or too_long:
+                chunks.append(" ".join(current))
+                current, current_length = [], 0
+            current.append(sentence)
+            current_length += len(sentence) + 1
+
+        chunks.append(" ".join(current))
+        return [c for c in chunks if len(c.strip()) > 50]
+
+    def adaptive_chunking(self, text: str) -> List[str]:
+        """
+        Chunking adaptativo: contenido denso (cifras, listas, importes) va en
+        chunks pequeños; la prosa narrativa en chunks más grandes
+        """
+        params = self.config.chunking_params[self.module]
+        min_scale = params.get("min_scale", 0.5)
+        max_scale = params.get("max_scale", 1.5)
+
+        chunks = []
+        current = ""
+        current_target = self.chunk_size
+
+        for paragraph in text.split('\n\n'):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+
+            # Denso -> objetivo pequeño, narrativo -> objetivo grande
+            density = content_density(paragraph)
+            target = int(self.chunk_size * (max_scale - (max_scale - min_scale) * density))
+
+            if current and len(current) + len(paragraph) + 2 > min(current_target, target):
+                chunks.append(current)
+                current = ""
+
+            if not current:
+                current_target = target
+
+            # Párrafos más largos que su objetivo se parten por frases
+            if len(paragraph) > target:
+                pieces = self._pack_sentences(
+                    self._bound_units(split_sentences(paragraph), target), target)
+                chunks.extend(pieces[:-1])
+                current = pieces[-1] if pieces else ""
+            else:
+                current = f"{current}\n\n{paragraph}" if current else paragraph
+
+        if current:
+            chunks.append(current)
+
+        return [c for c in chunks if len(c.strip()) > 50]
+
+    @staticmethod
+    def _bound_units(units: List[str], max_chars: int) -> List[str]:
+        """Partir frases más largas que max_chars por líneas y, si no basta, por ventanas"""
+        bounded = []
+        for unit in units:
+            if len(unit) <= max_chars:
+                bounded.append(unit)
+                continue
+            for line in unit.split("\n"):
+                for start in range(0, len(line), max_chars):
+                    piece = line[start:start + max_chars].strip()
+                    if piece:
+                        bounded.append(piece)
+        return bounded
+
+    @staticmethod
+    def _pack_sentences(sentences: List[str], max_chars: int) -> List[str]:
+        """Agrupar frases consecutivas sin superar max_chars"""
+        pieces = []
+        current = ""
+        for sentence in sentences:
+            if current and len(current) + len(sentence) + 1 > max_chars:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings en batch con el embedder del módulo (vía cache persistente)"""
+        return self.embedding_function(texts)
+
+    def smart_chunking(self, text: str, use_tokens: bool = False) -> List[Dict[str, Any]]:
         """
         Chunking inteligente que respeta límites de párrafos y frases
+        Con use_tokens=True el presupuesto se mide en tokens reales (tiktoken)
         """
+        if use_tokens:
+            return self.token_chunking(text)
+
         chunks_with_metadata = []
         paragraphs = text.split('\n\n')
 
@@ -180,56 +453,195 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
 
         return chunks_with_metadata
 
+    def _get_encoding(self):
+        """Encoding de tiktoken para el modelo (None si no está disponible)"""
+        if self._encoding is None and TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        """Número exacto de tokens (aproximado por palabras sin tiktoken)"""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text.split())
+        return len(encoding.encode(text))
+
+    def encode_paragraphs(self, paragraphs: List[str]) -> List[List[int]]:
+        """
+        Tokenizar párrafos en batch, reutilizando la cache por párrafo
+        Solo los párrafos no vistos pasan por encode_batch
+        """
+        encoding = self._get_encoding()
+        tokens = [self.token_cache.get(p) for p in paragraphs]
+        missing = sorted({p for p, t in zip(paragraphs, tokens) if t is None})
+
+        if missing:
+            # El resultado sale de encode_batch, no de la cache: con más párrafos
+            # únicos que su capacidad, los primeros ya estarían desalojados
+            encoded = dict(zip(missing, encoding.encode_batch(missing)))
+            for paragraph, paragraph_tokens in encoded.items():
+                self.token_cache.put(paragraph, paragraph_tokens)
+            tokens = [encoded[p] if t is None else t for p, t in zip(paragraphs, tokens)]
+
+        return tokens
+
+    def token_chunking(self, text: str, max_tokens: int = None,
+                       overlap_tokens: int = None) -> List[Dict[str, Any]]:
+        """
+        Chunking con presupuesto exacto de tokens
+        Agrupa párrafos hasta max_tokens; los párrafos más largos se cortan en
+        ventanas de exactamente max_tokens. El overlap son los últimos N tokens
+        """
+        if self._get_encoding() is None:
+            print("⚠️ tiktoken no disponible, usando chunking por caracteres")
+            return self.smart_chunking(text)
+
+        max_tokens = max_tokens or self.token_size
+        overlap_tokens = self.token_overlap if overlap_tokens is None else overlap_tokens
+        step = max_tokens - overlap_tokens
+
+        paragraphs = [p for p in text.split('\n\n') if p.strip()]
+        separator = self.encode_paragraphs(['\n\n'])[0]
+        token_chunks = []
+        current = []
+
+        for paragraph_tokens in self.encode_paragraphs(paragraphs):
+            # Párrafo que cabe en el chunk actual
+            if len(current) + len(separator) + len(paragraph_tokens) <= max_tokens:
+                current = current + separator + paragraph_tokens if current else list(paragraph_tokens)
+                continue
+
+            if current:
+                token_chunks.append(current)
+                tail = current[-overlap_tokens:] if overlap_tokens else []
+                current = tail + separator + paragraph_tokens
+            else:
+                current = list(paragraph_tokens)
+
+            # Párrafo demasiado largo: ventanas de tamaño exacto
+            while len(current) > max_tokens:
+                token_chunks.append(current[:max_tokens])
+                current = current[step:]
+
+        if current:
+            token_chunks.append(current)
+
+        texts = self._get_encoding().decode_batch(token_chunks)
+        return [
+            {
+                "text": chunk_text.strip(),
+                "metadata": {
+                    "chunk_index": i,
+                    "tokens": len(tokens),
+                    "type": "token_chunk"
+                }
+            }
+            for i, (chunk_text, tokens) in enumerate(zip(texts, token_chunks))
+        ]
+
+    def deduplicate_chunks(self, chunks: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Eliminar chunks casi duplicados (MinHash/LSH) antes de indexar
+        El chunk conservado guarda en metadatos las referencias de sus duplicados
+        """
+        records = []
+        for i, chunk in enumerate(chunks):
+            text, metadata = self._split_chunk(chunk)
+            records.append({"text": text, "metadata": dict(metadata), "position": i})
+
+        duplicates = self.deduplicator.find_duplicates([r["text"] for r in records])
+        if not duplicates:
+            return [{"text": r["text"], "metadata": r["metadata"]} for r in records]
+
+        merged = defaultdict(list)
+        for dup_idx, kept_idx in duplicates.items():
+            merged[kept_idx].append(records[dup_idx])
+
+        kept = []
+        for i, record in enumerate(records):
+            if i in duplicates:
+                continue
+            metadata = record["metadata"]
+            if i in merged:
+                dups = merged[i]
+                metadata["duplicate_count"] = len(dups)
+                metadata["duplicate_positions"] = ",".join(str(d["position"]) for d in dups)
+                sources = sorted({
+                    str(d["metadata"][key]) for d in dups
+                    for key in ("source", "doc_id") if key in d["metadata"]
+                })
+                if sources:
+                    metadata["duplicate_sources"] = ",".join(sources)
+            kept.append({"text": record["text"], "metadata": metadata})
+
+        print(f"🧹 Deduplicación: {len(duplicates)} chunks casi duplicados eliminados")
+        return kept
+
     @measure_performance
-    def index_chunks(self, chunks: List[str] = None):
-        """Indexar con metadatos enriquecidos"""
+    def index_chunks(self, chunks: List[str] = None, source: str = None,
+                     start_index: int = 0) -> List[str]:
+        """Indexar con metadatos enriquecidos (deduplicados y por lotes)"""
         if chunks is None:
             chunks = self.chunks
 
         if not chunks:
             raise ValueError("No hay chunks para indexar")
 
+        if self.use_dedup:
+            chunks = self.deduplicate_chunks(chunks)
+
         print(
             f"🔢 Indexando {len(chunks)} chunks con metadatos enriquecidos...")
 
-        # Preparar metadatos enriquecidos
+        ids = self._write_batches(chunks, source, start_index)
+
+        self.indexed = True
+        print(f"✅ {len(chunks)} chunks indexados con metadatos enriquecidos")
+        return ids
+
+    def _prepare_batch(self, batch: List[Any], first_index: int,
+                       source: Optional[str], last_index: int) -> Dict[str, List]:
+        """
+        Preparar un lote con metadatos enriquecidos
+        Las etiquetas salen del extractor en una pasada por chunk; la preparación
+        corre en el hilo del pipeline en paralelo con la escritura del lote anterior
+        """
         ids = []
         documents = []
         metadatas = []
 
-        for i, chunk in enumerate(chunks):
-            # Detectar información clave en el chunk
-            has_numbers = any(char.isdigit() for char in chunk)
-            has_policy = "política" in chunk.lower() or "policy" in chunk.lower()
-            has_benefits = "beneficio" in chunk.lower() or "benefit" in chunk.lower()
+        split = [self._split_chunk(chunk) for chunk in batch]
+        features = self.feature_extractor.extract_many([chunk for chunk, _ in split])
 
-            ids.append(f"chunk_{i}_v2")
+        for i, ((chunk, record_metadata), tags) in enumerate(zip(split, features),
+                                                             start=first_index):
+            ids.append(self._chunk_id(chunk))
             documents.append(chunk)
             metadatas.append({
+                **record_metadata,
                 "chunk_index": i,
                 "module": "2",
                 "timestamp": time.time(),
                 "length": len(chunk),
-                "has_numbers": has_numbers,
-                "has_policy": has_policy,
-                "has_benefits": has_benefits,
+                **tags,
                 "overlap_start": i > 0,  # Si tiene overlap con anterior
                 # Si tiene overlap con siguiente
-                "overlap_end": i < len(chunks) - 1
+                "overlap_end": i < last_index
             })
+            if source:
+                metadatas[-1]["source"] = source
 
-        # Indexar en ChromaDB
-        self.collection.add(
-            documents=documents,
-            ids=ids,
-            metadatas=metadatas
-        )
-
-        self.indexed = True
-        print(f"✅ {len(chunks)} chunks indexados con metadatos enriquecidos")
+        return {"ids": ids, "documents": documents, "metadatas": metadatas}
 
     def search_with_rerank(self, query: str, k: int = None) -> Dict[str, Any]:
         """Búsqueda con re-ranking basado en relevancia"""
+        return self.search_with_rerank_many([query], k)[0]
+
+    def search_with_rerank_many(self, queries: List[str], k: int = None) -> List[Dict[str, Any]]:
+        """Re-ranking en batch: una sola búsqueda (search_many) para todas las queries"""
         if k is None:
             k = self.config.retrieval_params[self.module]["top_k"]
 
@@ -237,18 +649,19 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
         initial_k = k * 2
 
         # Búsqueda inicial
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=initial_k
-        )
+        initial_results = self.search_many(queries, initial_k)
+        return [self._rerank(query, results, k)
+                for query, results in zip(queries, initial_results)]
 
-        if not results['documents'][0]:
+    def _rerank(self, query: str, results: Dict[str, Any], k: int) -> Dict[str, Any]:
+        """Re-rankear los candidatos de una query"""
+        if not results['documents']:
             return {"documents": [], "distances": [], "scores": []}
 
         # Re-ranking basado en múltiples factores
-        documents = results['documents'][0]
-        distances = results['distances'][0]
-        metadatas = results['metadatas'][0] if 'metadatas' in results else []
+        documents = results['documents']
+        distances = results['distances']
+        metadatas = results.get('metadatas') or []
 
         # Calcular scores para re-ranking
         reranked = []
@@ -292,11 +705,9 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
             "metadatas": [r['metadata'] for r in top_results]
         }
 
-    def generate_response(self, query: str, context: str) -> str:
-        """Generar respuesta con prompt optimizado"""
-
-        # Prompt mejorado del Módulo 2
-        prompt = f"""
+    def build_prompt(self, query: str, context: str) -> str:
+        """Prompt optimizado del Módulo 2"""
+        return f"""
         Eres un asistente experto en recursos humanos analizando documentos oficiales de la empresa.
         
         CONTEXTO RELEVANTE:
@@ -316,6 +727,12 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
         RESPUESTA:
         """
 
+    def generate_response(self, query: str, context: str) -> str:
+        """Generar respuesta con prompt optimizado"""
+
+        # Prompt mejorado del Módulo 2
+        prompt = self.build_prompt(query, context)
+
         # Generar respuesta con temperatura optimizada
         response = self.openai_client.chat.completions.create(
             model=self.model,
@@ -326,9 +743,17 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
 
         return response.choices[0].message.content
 
-    def query(self, question: str, k: int = None) -> Dict[str, Any]:
+    def _retrieve_many(self, questions: List[str], k: int = None) -> List[Dict[str, Any]]:
+        """Retrieval en batch, con re-ranking si está activo"""
+        if self.use_reranking:
+            return self.search_with_rerank_many(questions, k)
+        return self.search_many(questions, k)
+
+    def query(self, question: str, k: int = None,
+              search_results: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Pipeline RAG optimizado con cache y re-ranking
+        Con search_results (de query_many) se omite el retrieval
         """
         print(f"\n{'='*50}")
         print(f"📝 Query: {question}")
@@ -350,29 +775,37 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
         start_time = time.time()
 
         # 1. Retrieval con re-ranking
-        search_start = time.time()
-        if self.use_reranking:
-            search_results = self.search_with_rerank(question, k)
-            print(f"🎯 Usando re-ranking")
+        if search_results is not None:
+            search_time = search_results.get("retrieval_time_ms", 0.0)
         else:
-            search_results = self.search(question, k)
-        search_time = (time.time() - search_start) * 1000
+            search_start = time.time()
+            if self.use_reranking:
+                search_results = self.search_with_rerank(question, k)
+                print(f"🎯 Usando re-ranking")
+            else:
+                search_results = self.search(question, k)
+            search_time = (time.time() - search_start) * 1000
 
         # 2. Preparar contexto
         context = "\n\n---\n\n".join(search_results["documents"])
 
-        # 3. Generación
+        # 3. Generación (sin chunks sobre el umbral no se llama al LLM)
         gen_start = time.time()
-        response = self.generate_response(question, context)
+        if search_results["documents"]:
+            response = self.generate_response(question, context)
+        else:
+            response = self.NO_CONTEXT_RESPONSE
         gen_time = (time.time() - gen_start) * 1000
 
         # Métricas
         total_time = (time.time() - start_time) * 1000
 
-        # Estimar costos (con prompt optimizado)
-        input_tokens = len(context.split()) + \
-            len(question.split()) + 50  # +50 por prompt
-        output_tokens = len(response.split())
+        # Costos con conteo exacto de tokens del prompt y la respuesta
+        if search_results["documents"]:
+            input_tokens = self.count_tokens(self.build_prompt(question, context))
+            output_tokens = self.count_tokens(response)
+        else:
+            input_tokens = output_tokens = 0
         cost = (input_tokens * 0.0015 + output_tokens * 0.002) / 1000
 
         # Registrar en métricas globales
@@ -393,6 +826,7 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
             "context_length": len(context),
             "from_cache": False,
             "used_reranking": self.use_reranking,
+            "llm_called": bool(search_results["documents"]),
             "metrics": {
                 "retrieval_time_ms": search_time,
                 "generation_time_ms": gen_time,
@@ -420,22 +854,57 @@ class Module2_OptimizedRAG(Module1_BasicRAG):
         return result
 
     def clear_cache(self):
-        """Limpiar todos los caches"""
+        """
+        Limpiar los caches en memoria de este proceso (respuestas y tokens)
+        La cache de embeddings es persistente y compartida: ver clear_embedding_cache
+        """
         self.query_cache.clear()
-        self.embedding_cache.clear()
+        self.token_cache.clear()
         print("🗑️ Cache limpiado")
 
+    def clear_embedding_cache(self):
+        """Vaciar la cache persistente de embeddings (SQLite, compartida entre procesos)"""
+        self.embedding_cache.clear()
+        print("🗑️ Cache de embeddings vaciada")
+
     def get_cache_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas del cache"""
+        embedding_stats = self.embedding_cache.get_stats()
         return {
             "query_cache_size": len(self.query_cache.cache),
             "query_cache_capacity": self.query_cache.capacity,
-            "embedding_cache_size": len(self.embedding_cache.cache),
-            "embedding_cache_capacity": self.embedding_cache.capacity,
-            "cache_hit_rate": "N/A"  # Requeriría tracking adicional
+            "embedding_cache_size": len(self.embedding_cache),
+            "embedding_cache_capacity": self.embedding_cache.max_entries,
+            "embedding_cache_hits": embedding_stats["hits"],
+            "embedding_cache_misses": embedding_stats["misses"],
+            "cache_hit_rate": embedding_stats["hit_rate"]
         }
 
 
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*[-•*\d])")
+_DENSE_TOKEN = re.compile(r"\d|[€$%]")
+_LIST_LINE = re.compile(r"^\s*(?:[-•*]|\d+[.)])\s", re.MULTILINE)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Helper: dividir texto en frases (y elementos de lista)"""
+    return [s.strip() for s in _SENTENCE_BOUNDARY.split(text) if s and s.strip()]
+
+
+def content_density(text: str) -> float:
+    """
+    Helper: densidad informativa en [0, 1]
+    Proporción de palabras con cifras/importes más proporción de líneas de lista
+    """
+    words = text.split()
+    if not words:
+        return 0.0
+    dense_words = sum(1 for word in words if _DENSE_TOKEN.search(word))
+    lines = text.count("\n") + 1
+    list_lines = len(_LIST_LINE.findall(text))
+    return min(1.0, 2 * dense_words / len(words) + 0.5 * list_lines / lines)
+
+
 def query_has_numbers(query: str) -> bool:
     """Helper: verificar si la query contiene números"""
     return any(char.isdigit() for char in query)
@@ -13,7 +13,6 @@ from shared_config import Module, MetricsTracker
 try:
     from langchain.document_loaders import PyPDFLoader, TextLoader
     from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain.embeddings import OpenAIEmbeddings
     from langchain.vectorstores import Chroma as LangChainChroma
     from langchain.chains import RetrievalQA, ConversationalRetrievalChain
     from langchain.llms import OpenAI as LangChainOpenAI
@@ -27,7 +26,8 @@ except ImportError:
 try:
     from llama_index import VectorStoreIndex, Document, SimpleDirectoryReader
     from llama_index.llms import OpenAI as LlamaOpenAI
-    from llama_index.embeddings import OpenAIEmbedding
+    from llama_index.embeddings.base import BaseEmbedding
+    from llama_index.bridge.pydantic import PrivateAttr
     from llama_index.memory import ChatMemoryBuffer
     from llama_index.indices.postprocessor import SentenceTransformerRerank
     LLAMAINDEX_AVAILABLE = True
@@ -36,6 +36,30 @@ except ImportError:
     print("⚠️ LlamaIndex no instalado. Instala con: pip install llama-index")
 
 
+if LLAMAINDEX_AVAILABLE:
+    class LlamaIndexEmbedder(BaseEmbedding):
+        """Adaptador del Embedder del workshop a la interfaz de LlamaIndex"""
+
+        _embedder: Any = PrivateAttr()
+
+        def __init__(self, embedder, **kwargs):
+            super().__init__(model_name=embedder.model,
+                             embed_batch_size=embedder.batch_size, **kwargs)
+            self._embedder = embedder
+
+        def _get_query_embedding(self, query: str) -> List[float]:
+            return self._embedder.embed_query(query)
+
+        async def _aget_query_embedding(self, query: str) -> List[float]:
+            return self._get_query_embedding(query)
+
+        def _get_text_embedding(self, text: str) -> List[float]:
+            return self._embedder.embed_query(text)
+
+        def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+            return self._embedder.embed_documents(texts)
+
+
 class Module3_AdvancedRAG(Module2_OptimizedRAG):
     """
     Versión 3: RAG con Frameworks Profesionales
@@ -52,6 +76,7 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
         super().__init__()
 
         self.module = Module.ADVANCED
+        self._apply_chunking_params()
         self.framework = framework.lower()
 
         print(f"📚 Module 3 AdvancedRAG inicializando...")
@@ -82,11 +107,8 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
         """Configurar LangChain completo"""
         print("🔗 Configurando LangChain...")
 
-        # Embeddings
-        self.lc_embeddings = OpenAIEmbeddings(
-            model=self.embedding_model,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # Embeddings: el embedder del módulo (embed_documents / embed_query)
+        self.lc_embeddings = self.embedding_function
 
         # Vector Store
         self.lc_vectorstore = LangChainChroma(
@@ -108,12 +130,29 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
             output_key="answer"
         )
 
+        # Chains (conversacional y QA simple)
+        self._build_langchain_chains()
+
+        # Configurar agent con tools
+        self.setup_langchain_agent()
+
+    def _langchain_retriever(self, k: int = 4):
+        """Retriever del vectorstore; con "mmr" en retrieval_params, búsqueda MMR de LangChain"""
+        params = self.config.retrieval_params[self.module]
+        if not params.get("mmr"):
+            return self.lc_vectorstore.as_retriever(search_kwargs={"k": k})
+        return self.lc_vectorstore.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": k, "fetch_k": k * params["mmr_fetch_factor"],
+                           "lambda_mult": params["mmr_lambda"]}
+        )
+
+    def _build_langchain_chains(self):
+        """Crear las chains con el retriever del módulo actual"""
         # Chain conversacional
         self.conversation_chain = ConversationalRetrievalChain.from_llm(
             llm=self.lc_llm,
-            retriever=self.lc_vectorstore.as_retriever(
-                search_kwargs={"k": 3}
-            ),
+            retriever=self._langchain_retriever(k=3),
             memory=self.memory,
             return_source_documents=True,
             verbose=False
@@ -123,13 +162,10 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
         self.qa_chain = RetrievalQA.from_chain_type(
             llm=self.lc_llm,
             chain_type="stuff",
-            retriever=self.lc_vectorstore.as_retriever(),
+            retriever=self._langchain_retriever(),
             return_source_documents=True
         )
 
-        # Configurar agent con tools
-        self.setup_langchain_agent()
-
     def setup_langchain_agent(self):
         """Configurar agent con herramientas"""
 
@@ -161,17 +197,24 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
 
         print("   ✅ Agent con tools configurado")
 
-    def langchain_index_documents(self, documents: List[str]):
-        """Indexar documentos con LangChain"""
+    def langchain_index_documents(self, documents: List[str], ids: List[str] = None,
+                                  metadatas: List[Dict[str, Any]] = None):
+        """
+        Indexar documentos con LangChain
+        Con ids (IDs por contenido) la escritura es un upsert: re-indexar un
+        documento no duplica sus chunks
+        """
         if isinstance(documents[0], str):
             # Si son strings, convertir a Documents de LangChain
             from langchain.schema import Document as LCDocument
-            lc_docs = [LCDocument(page_content=doc) for doc in documents]
+            lc_docs = [LCDocument(page_content=doc,
+                                  metadata=metadatas[i] if metadatas else {})
+                       for i, doc in enumerate(documents)]
         else:
             lc_docs = documents
 
         # Añadir a vectorstore
-        self.lc_vectorstore.add_documents(lc_docs)
+        self.lc_vectorstore.add_documents(lc_docs, ids=ids)
         print(f"   ✅ {len(lc_docs)} documentos indexados con LangChain")
 
     # ============= LLAMAINDEX SETUP =============
@@ -180,11 +223,8 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
         """Configurar LlamaIndex completo"""
         print("📚 Configurando LlamaIndex...")
 
-        # Embeddings
-        self.li_embeddings = OpenAIEmbedding(
-            model=self.embedding_model,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # Embeddings: el embedder del módulo adaptado a LlamaIndex
+        self.li_embeddings = LlamaIndexEmbedder(self.embedding_function)
 
         # LLM
         self.li_llm = LlamaOpenAI(
@@ -207,16 +247,27 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
 
         print("   ✅ LlamaIndex configurado")
 
-    def llamaindex_index_documents(self, documents: List[str]):
-        """Indexar documentos con LlamaIndex"""
+    def llamaindex_index_documents(self, documents: List[str], ids: List[str] = None,
+                                   metadatas: List[Dict[str, Any]] = None):
+        """
+        Indexar documentos con LlamaIndex
+        Con ids, cada chunk es un documento con ese doc_id y las re-indexaciones
+        solo insertan los que faltan o cambiaron (refresh_ref_docs)
+        """
 
         # Convertir a Documents de LlamaIndex
         li_docs = []
         for i, doc in enumerate(documents):
             if isinstance(doc, str):
+                # Los metadatos del chunk se guardan en el nodo, pero no entran en
+                # el texto que se embebe ni en el que ve el LLM
+                extra = metadatas[i] if metadatas else {}
                 li_docs.append(Document(
                     text=doc,
-                    metadata={"doc_id": i, "source": "training_data"}
+                    metadata={"doc_id": i, "source": "training_data", **extra},
+                    excluded_embed_metadata_keys=list(extra),
+                    excluded_llm_metadata_keys=list(extra),
+                    **({"doc_id": ids[i]} if ids else {})
                 ))
             else:
                 li_docs.append(doc)
@@ -227,19 +278,40 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
                 li_docs,
                 embed_model=self.li_embeddings
             )
+        elif ids:
+            self.li_index.refresh_ref_docs(li_docs)
         else:
             for doc in li_docs:
                 self.li_index.insert(doc)
 
-        # Crear query engine con re-ranking
+        self._build_query_engine()
+
+        print(f"   ✅ {len(li_docs)} documentos indexados con LlamaIndex")
+
+    def _build_query_engine(self):
+        """
+        Query engine con re-ranking. Con "mmr" en retrieval_params el retriever
+        de LlamaIndex diversifica (mmr_threshold: 1 = solo relevancia)
+        """
+        params = self.config.retrieval_params[self.module]
+        mmr = {}
+        if params.get("mmr"):
+            mmr = {"vector_store_query_mode": "mmr",
+                   "vector_store_kwargs": {"mmr_threshold": params["mmr_lambda"]}}
         self.query_engine = self.li_index.as_query_engine(
             llm=self.li_llm,
             similarity_top_k=5,
             node_postprocessors=[self.reranker],
-            streaming=False
+            streaming=False,
+            **mmr
         )
 
-        print(f"   ✅ {len(li_docs)} documentos indexados con LlamaIndex")
+    def _apply_retrieval_params(self):
+        """Recrear chains y query engine al cambiar de módulo (p. ej. MMR en producción)"""
+        if getattr(self, "lc_vectorstore", None) is not None:
+            self._build_langchain_chains()
+        if getattr(self, "li_index", None) is not None:
+            self._build_query_engine()
 
     # ============= HYBRID SETUP =============
 
@@ -405,7 +477,39 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
         """Override del método query para usar frameworks"""
         return self.query_with_framework(question, use_memory=True)
 
-    def index_chunks(self, chunks: List[str] = None):
+    def query_many(self, questions: List[str], k: int = None,
+                   delay: float = 0.0) -> List[Dict[str, Any]]:
+        """Los frameworks hacen su propio retrieval: una query por pregunta"""
+        results = []
+        for i, question in enumerate(questions):
+            if i and delay:
+                time.sleep(delay)
+            results.append(self.query(question, k))
+        return results
+
+    def _supports_native_search(self) -> bool:
+        """
+        Búsqueda nativa (search/search_many) disponible: con LangChain sobre la
+        colección Chroma de su vector store; LlamaIndex mantiene su propio índice
+        en memoria y solo se consulta con su query engine
+        """
+        if self.framework in ("langchain", "hybrid") and LANGCHAIN_AVAILABLE:
+            return True
+        return not (self.framework in ("llamaindex", "hybrid") and LLAMAINDEX_AVAILABLE)
+
+    def _retrieval_collection(self):
+        """Colección para la búsqueda nativa en batch (search_many)"""
+        if not self._supports_native_search():
+            raise ValueError(
+                f"La búsqueda nativa no está disponible con {self.framework}: "
+                "usa query_with_framework"
+            )
+        if self.framework in ("langchain", "hybrid") and LANGCHAIN_AVAILABLE:
+            return self.lc_vectorstore._collection
+        return self.collection
+
+    def index_chunks(self, chunks: List[str] = None, source: str = None,
+                     start_index: int = 0) -> Optional[List[str]]:
         """Override para indexar con frameworks"""
         if chunks is None:
             chunks = self.chunks
@@ -415,17 +519,75 @@ class Module3_AdvancedRAG(Module2_OptimizedRAG):
 
         print(f"🔢 Indexando {len(chunks)} chunks con {self.framework}...")
 
+        chunk_ids = None
+        metadatas = None
+        if self._uses_framework():
+            # Los frameworks reciben los mismos IDs por contenido y metadatos
+            # (registro, deduplicación, etiquetas) que el camino nativo
+            if self.use_dedup:
+                chunks = self.deduplicate_chunks(chunks)
+            prepared = self._prepare_batch(chunks, start_index, source,
+                                           start_index + len(chunks) - 1)
+            unique = {}
+            for chunk_id, text, metadata in zip(prepared["ids"], prepared["documents"],
+                                                prepared["metadatas"]):
+                unique.setdefault(chunk_id, (text, metadata))
+            chunk_ids = list(unique)
+            chunks = [text for text, _ in unique.values()]
+            metadatas = [metadata for _, metadata in unique.values()]
+
         if self.framework == "langchain" and LANGCHAIN_AVAILABLE:
-            self.langchain_index_documents(chunks)
+            self.langchain_index_documents(chunks, ids=chunk_ids, metadatas=metadatas)
         elif self.framework == "llamaindex" and LLAMAINDEX_AVAILABLE:
-            self.llamaindex_index_documents(chunks)
-        elif self.framework == "hybrid":
+            self.llamaindex_index_documents(chunks, ids=chunk_ids, metadatas=metadatas)
+        elif self.framework == "hybrid" and self._uses_framework():
             if LANGCHAIN_AVAILABLE:
-                self.langchain_index_documents(chunks)
+                self.langchain_index_documents(chunks, ids=chunk_ids, metadatas=metadatas)
             if LLAMAINDEX_AVAILABLE:
-                self.llamaindex_index_documents(chunks)
+                self.llamaindex_index_documents(chunks, ids=chunk_ids, metadatas=metadatas)
         else:
             # Fallback al método padre
-            super().index_chunks(chunks)
+            chunk_ids = super().index_chunks(chunks, source=source,
+                                             start_index=start_index)
 
         self.indexed = True
+        return chunk_ids
+
+    def _uses_framework(self) -> bool:
+        """Los chunks viven en los stores de LangChain / LlamaIndex, no en self.collection"""
+        return ((self.framework == "langchain" and LANGCHAIN_AVAILABLE)
+                or (self.framework == "llamaindex" and LLAMAINDEX_AVAILABLE)
+                or (self.framework == "hybrid"
+                    and (LANGCHAIN_AVAILABLE or LLAMAINDEX_AVAILABLE)))
+
+    def _chunks_present(self, chunk_ids: List[str]) -> bool:
+        """Verificar los chunks del manifest en los stores del framework"""
+        if not self._uses_framework():
+            return super()._chunks_present(chunk_ids)
+        if not chunk_ids:
+            return False
+        if self.framework in ("langchain", "hybrid") and LANGCHAIN_AVAILABLE:
+            found = self.lc_vectorstore._collection.get(ids=chunk_ids, include=[])
+            if len(found["ids"]) != len(chunk_ids):
+                return False
+        if self.framework in ("llamaindex", "hybrid") and LLAMAINDEX_AVAILABLE:
+            # El índice de LlamaIndex vive en memoria: tras reiniciar está vacío
+            if self.li_index is None:
+                return False
+            indexed = self.li_index.ref_doc_info
+            if any(chunk_id not in indexed for chunk_id in chunk_ids):
+                return False
+        return True
+
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """Eliminar chunks obsoletos de los stores del framework"""
+        if not self._uses_framework():
+            return super()._delete_chunks(chunk_ids)
+        if self.framework in ("langchain", "hybrid") and LANGCHAIN_AVAILABLE:
+            self.lc_vectorstore.delete(ids=chunk_ids)
+        if self.framework in ("llamaindex", "hybrid") and LLAMAINDEX_AVAILABLE and self.li_index:
+            for chunk_id in chunk_ids:
+                self.li_index.delete_ref_doc(chunk_id, delete_from_docstore=True)
+        self.lexical_index.remove(chunk_ids)
+        if self.full_vectors is not None:
+            self.full_vectors.delete(chunk_ids)
@@ -15,7 +15,11 @@ from collections import OrderedDict, defaultdict
 from functools import lru_cache, wraps
 import threading
 
+import numpy as np
+
+from module_1_basics import IngestManifest
 from module_3_advanced import Module3_AdvancedRAG
+from vector_stores import write_snapshot, read_snapshot_manifest, SnapshotCollection
 from shared_config import Module, MetricsTracker
 
 # Configurar logging
@@ -309,6 +313,10 @@ class Module4_ProductionRAG(Module3_AdvancedRAG):
         super().__init__(framework)
 
         self.module = Module.PRODUCTION
+        # Snapshot de solo lectura cargado con load_snapshot (sirve las búsquedas)
+        self.snapshot_collection = None
+        self._apply_chunking_params()
+        self._apply_retrieval_params()
 
         print("🚀 Module 4 ProductionRAG inicializando...")
 
@@ -387,10 +395,15 @@ class Module4_ProductionRAG(Module3_AdvancedRAG):
         question: str,
         user_id: str = "anonymous",
         use_cache: bool = True,
-        tier: str = "default"
+        tier: str = "default",
+        search_results: Dict[str, Any] = None,
+        admitted: bool = False
     ) -> Dict[str, Any]:
         """
         Query con todas las features de producción
+        Con search_results (de batch_query) se genera sobre los chunks ya
+        recuperados en lugar de hacer el retrieval del framework.
+        admitted: batch_query ya comprobó rate limit y cache
         """
 
         start_time = time.time()
@@ -398,33 +411,27 @@ class Module4_ProductionRAG(Module3_AdvancedRAG):
 
         try:
             # 1. Rate limiting
-            if self.config["enable_rate_limiting"]:
+            if self.config["enable_rate_limiting"] and not admitted:
                 if not self.rate_limiter.check_limit(user_id, tier):
                     raise Exception(f"Rate limit exceeded. Try again later.")
 
             # 2. Cache check
             cache_key = None
             if use_cache and self.config["enable_cache"]:
-                cache_key = hashlib.md5(
-                    f"{question}_{self.framework}".encode()
-                ).hexdigest()
+                cache_key = self._cache_key(
+                    question, native=search_results is not None or self._serves_native())
 
-                cached = self.cache.get(cache_key)
+                cached = None if admitted else self._cached_result(cache_key)
                 if cached:
-                    cache_hit = True
-                    # Deserializar respuesta
-                    result = json.loads(cached)
-                    result["cache_hit"] = True
-                    result["latency_ms"] = 5  # Cache hit = 5ms
-
-                    # Registrar métrica
-                    self.metrics_collector.record("cache_hit", 1)
-
-                    return result
+                    return cached
 
             # 3. Circuit breaker
             def execute_query():
-                return super().query_with_framework(question, use_memory=True)
+                if search_results is not None:
+                    return self._answer_from_results(question, search_results)
+                if self._serves_native():
+                    return self._answer_from_results(question, self.search_many([question])[0])
+                return self.query_with_framework(question, use_memory=True)
 
             result = self.circuit_breaker.call(execute_query)
 
@@ -502,18 +509,205 @@ class Module4_ProductionRAG(Module3_AdvancedRAG):
         return await loop.run_in_executor(None, self.query, question, **kwargs)
 
     def batch_query(self, questions: List[str], **kwargs) -> List[Dict[str, Any]]:
-        """Procesar queries en batch"""
+        """
+        Procesar queries en batch: rate limit y cache por pregunta primero; el
+        retrieval de las que faltan se hace en una sola búsqueda vectorizada
+        (search_many) y se genera por pregunta
+        """
 
-        results = []
-        for question in questions:
+        user_id = kwargs.get("user_id", "anonymous")
+        use_cache = kwargs.get("use_cache", True)
+        tier = kwargs.get("tier", "default")
+        native = self.snapshot_collection is not None or self._supports_native_search()
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        pending = []
+        for i, question in enumerate(questions):
+            if (self.config["enable_rate_limiting"]
+                    and not self.rate_limiter.check_limit(user_id, tier)):
+                results[i] = self.fallback_response(question, "Rate limit exceeded. Try again later.")
+            elif use_cache and self.config["enable_cache"]:
+                results[i] = self._cached_result(self._cache_key(question, native))
+            if results[i] is None:
+                pending.append(i)
+
+        retrieved = [None] * len(pending)
+        if pending and native:
             try:
-                result = self.query(question, **kwargs)
-                results.append(result)
+                retrieved = self.search_many([questions[i] for i in pending])
             except Exception as e:
-                results.append(self.fallback_response(question, str(e)))
+                logger.warning(f"search_many falló, retrieval por pregunta: {str(e)}")
+
+        for i, search_results in zip(pending, retrieved):
+            try:
+                results[i] = self.query_with_production_features(
+                    questions[i],
+                    user_id=user_id,
+                    use_cache=use_cache,
+                    tier=tier,
+                    search_results=search_results,
+                    admitted=True
+                )
+            except Exception as e:
+                results[i] = self.fallback_response(questions[i], str(e))
 
         return results
 
+    def _cache_key(self, question: str, native: bool) -> str:
+        """
+        Clave de cache por pregunta y camino de respuesta: las respuestas nativas
+        (prompt del Módulo 2 sobre search_many) no se sirven como del framework
+        """
+        path = f"{self.framework}_native" if native else self.framework
+        return hashlib.md5(f"{question}_{path}".encode()).hexdigest()
+
+    def _cached_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Respuesta guardada en cache, o None si no está"""
+        cached = self.cache.get(cache_key)
+        if not cached:
+            return None
+
+        # Deserializar respuesta
+        result = json.loads(cached)
+        result["cache_hit"] = True
+        result["latency_ms"] = 5  # Cache hit = 5ms
+
+        # Registrar métrica
+        self.metrics_collector.record("cache_hit", 1)
+
+        return result
+
+    def _answer_from_results(self, question: str, search_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Generar la respuesta a partir de chunks ya recuperados"""
+
+        documents = search_results["documents"]
+        if not documents:
+            # Ningún chunk supera el umbral de similitud: sin llamada al LLM
+            return {"answer": self.NO_CONTEXT_RESPONSE, "sources": [], "framework": "native",
+                    "cost": 0.0, "tokens": 0}
+
+        metadatas = search_results.get("metadatas") or [{}] * len(documents)
+        context = "\n\n---\n\n".join(documents)
+        answer = self.generate_response(question, context)
+
+        input_tokens = self.count_tokens(self.build_prompt(question, context))
+        output_tokens = self.count_tokens(answer)
+
+        return {
+            "answer": answer,
+            "sources": [{"text": doc[:200], "metadata": meta or {}}
+                        for doc, meta in zip(documents[:3], metadatas[:3])],
+            "framework": "native",
+            "cost": (input_tokens * 0.0015 + output_tokens * 0.002) / 1000,
+            "tokens": input_tokens + output_tokens
+        }
+
+    # ============= MMR =============
+
+    def _serves_native(self) -> bool:
+        """
+        Query individual con retrieval nativo en lugar del framework: solo con un
+        snapshot cargado. Sin él se usa el framework (memoria, chains), cuyo
+        retriever ya aplica MMR (ver _apply_retrieval_params)
+        """
+        return self.snapshot_collection is not None
+
+    def search_many(self, queries: List[str], k: int = None,
+                    include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """
+        Búsqueda con diversificación MMR (retrieval_params["mmr"]): se recuperan
+        k * mmr_fetch_factor candidatos y se eligen k que sean relevantes y poco
+        redundantes entre sí (chunks solapados del mismo pasaje)
+        """
+        params = self.config.retrieval_params[self.module]
+        if not params.get("mmr"):
+            return super().search_many(queries, k, include_embeddings)
+
+        if k is None:
+            k = params["top_k"]
+        # Los embeddings de los candidatos vienen de la colección, sin re-embeber
+        candidates = super().search_many(queries, k * params["mmr_fetch_factor"],
+                                         include_embeddings=True)
+
+        diversified = []
+        for results in candidates:
+            order = []
+            if results["documents"]:
+                vectors = np.asarray(results["embeddings"], dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                if results["similarities"][0] is None:
+                    # Atajo léxico: relevancia relativa al mejor score BM25
+                    scores = np.asarray(results["scores"], dtype=np.float32)
+                    relevance = scores / scores.max()
+                else:
+                    relevance = np.asarray(results["similarities"], dtype=np.float32)
+                order = maximal_marginal_relevance(relevance, vectors @ vectors.T, k,
+                                                   lambda_mult=params["mmr_lambda"])
+            diversified.append({key: [values[i] for i in order]
+                                for key, values in results.items()
+                                if include_embeddings or key != "embeddings"})
+        return diversified
+
+    # ============= SNAPSHOTS =============
+
+    def _retrieval_collection(self):
+        """Con un snapshot cargado, todas las búsquedas nativas van contra él"""
+        if self.snapshot_collection is not None:
+            return self.snapshot_collection
+        return super()._retrieval_collection()
+
+    def _snapshot_path(self, path: Optional[str]) -> str:
+        return path or os.path.join(self.config.storage_params["snapshot_dir"],
+                                    self.collection_name)
+
+    def save_snapshot(self, path: str = None, page_size: int = 1000) -> str:
+        """
+        Guardar el índice actual (textos, metadatos y embeddings) como snapshot
+        versionado que otros procesos pueden abrir mapeado en memoria
+        """
+        path = self._snapshot_path(path)
+        collection = self._retrieval_collection()
+        total = collection.count()
+        include = ["documents", "metadatas", "embeddings"]
+
+        def pages():
+            # Backends locales: exportación en una pasada; Chroma pagina con offset
+            if hasattr(collection, "iter_pages"):
+                exported = collection.iter_pages(page_size, include)
+            else:
+                exported = (collection.get(limit=page_size, offset=offset, include=include)
+                            for offset in range(0, total, page_size))
+            for page in exported:
+                yield page["ids"], page["documents"], page["metadatas"], page["embeddings"]
+
+        write_snapshot(path, pages(), total, info={
+            "collection": self.collection_name,
+            **self._embedding_signature()
+        }, dtype=self.config.storage_params["snapshot_dtype"])
+        print(f"💾 Snapshot guardado: {total} chunks en {path}")
+        return path
+
+    def load_snapshot(self, path: str = None):
+        """
+        Servir desde un snapshot de solo lectura (np.load con mmap_mode='r')
+        Todos los procesos que lo abran comparten las páginas en memoria
+        """
+        path = self._snapshot_path(path)
+        manifest = read_snapshot_manifest(path)
+        embedding = self._embedding_signature()
+        if not IngestManifest.same_embedding(manifest, embedding):
+            raise ValueError(
+                f"El snapshot usa {manifest.get('embedding_model')} "
+                f"(dimensiones: {manifest.get('dimensions')}), incompatible con "
+                f"{embedding['embedding_model']} (dimensiones: {embedding['dimensions']})")
+
+        self.snapshot_collection = SnapshotCollection(
+            path, self.embedding_function,
+            block_rows=self.config.vector_index_params["numpy"]["block_rows"])
+        self.indexed = self.snapshot_collection.count() > 0
+        print(f"📂 Snapshot v{manifest['version']} cargado: {manifest['count']} chunks "
+              f"desde {path}")
+
     def get_health(self) -> Dict[str, Any]:
         """Obtener estado de salud del sistema"""
 
@@ -549,3 +743,26 @@ class Module4_ProductionRAG(Module3_AdvancedRAG):
         """Exportar métricas en formato Prometheus"""
 
         return self.metrics_collector.export_prometheus()
+
+
+def maximal_marginal_relevance(relevance: np.ndarray, similarity: np.ndarray, k: int,
+                               lambda_mult: float = 0.5) -> List[int]:
+    """
+    Helper: selección MMR vectorizada sobre una matriz de similitud (n, n)
+    score(d) = λ·relevancia(d) - (1 - λ)·max similitud(d, seleccionados)
+    Cada paso es un argmax sobre todos los candidatos; la redundancia se
+    actualiza con la fila del último elegido. Devuelve índices en orden
+    """
+    k = min(k, len(relevance))
+    selected: List[int] = []
+    redundancy = np.zeros(len(relevance), dtype=np.float32)
+    available = np.ones(len(relevance), dtype=bool)
+    for step in range(k):
+        scores = np.where(available,
+                          lambda_mult * relevance - (1 - lambda_mult) * redundancy,
+                          -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = similarity[best] if step == 0 else np.maximum(redundancy, similarity[best])
+    return selected
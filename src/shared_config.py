@@ -26,7 +26,7 @@ class RAGMasterConfig:
     
     # CONSTANTES (nunca cambian durante el workshop)
     BASE_DOCUMENT = "data/company_handbook.pdf"
-    VECTOR_DB = "chromadb"
+    VECTOR_DB = os.getenv("VECTOR_DB", "chromadb")  # chromadb | faiss | numpy | quantized | sharded
     COLLECTION_NAME = "rag_workshop_2025"
     API_VERSION = "v1"
     
@@ -52,19 +52,47 @@ class RAGMasterConfig:
     # CHUNKING PARAMETERS (evolucionan)
     chunking_params = {
         Module.BASICS: {"size": 1000, "overlap": 0, "strategy": "fixed"},
-        Module.OPTIMIZED: {"size": 1000, "overlap": 200, "strategy": "recursive"},
-        Module.ADVANCED: {"size": 1000, "overlap": 200, "strategy": "semantic"},
-        Module.PRODUCTION: {"size": 800, "overlap": 200, "strategy": "adaptive"}
+        Module.OPTIMIZED: {"size": 1000, "overlap": 200, "strategy": "recursive",
+                           "token_size": 256, "token_overlap": 50},
+        Module.ADVANCED: {"size": 1000, "overlap": 200, "strategy": "semantic",
+                          "token_size": 256, "token_overlap": 50,
+                          "breakpoint_percentile": 20},  # Cortes en el 20% menos similar
+        Module.PRODUCTION: {"size": 800, "overlap": 200, "strategy": "adaptive",
+                            "token_size": 200, "token_overlap": 50,
+                            "min_scale": 0.5, "max_scale": 1.5}  # Rango de tamaño según densidad
     }
     
     # RETRIEVAL PARAMETERS
+    # threshold: similitud coseno mínima query-chunk, en [-1, 1]. Con embeddings
+    # normalizados se obtiene de la distancia L2² como 1 - d/2. La escala depende
+    # del modelo: con text-embedding-3-small los chunks relevantes suelen quedar
+    # entre 0.3 y 0.6 (0.7 o más descarta casi todo) y con el backend hash no es
+    # comparable. Desactivado (0) por defecto; RETRIEVAL_THRESHOLD fija un valor
+    # calibrado con queries reales para los módulos 2-4. No se aplica al atajo
+    # léxico de la búsqueda híbrida, cuyos scores son relativos al mejor BM25
+    SIMILARITY_THRESHOLD = float(os.getenv("RETRIEVAL_THRESHOLD", "0"))
     retrieval_params = {
         Module.BASICS: {"top_k": 3, "threshold": 0.0},
-        Module.OPTIMIZED: {"top_k": 5, "threshold": 0.7},
-        Module.ADVANCED: {"top_k": 5, "threshold": 0.75, "rerank": True},
-        Module.PRODUCTION: {"top_k": 10, "threshold": 0.8, "rerank": True, "mmr": True}
+        Module.OPTIMIZED: {"top_k": 5, "threshold": SIMILARITY_THRESHOLD},
+        Module.ADVANCED: {"top_k": 5, "threshold": SIMILARITY_THRESHOLD, "rerank": True},
+        Module.PRODUCTION: {"top_k": 10, "threshold": SIMILARITY_THRESHOLD,
+                            "rerank": True, "mmr": True,
+                            "mmr_lambda": 0.5,  # 1 = solo relevancia, 0 = solo diversidad
+                            "mmr_fetch_factor": 3}  # Candidatos para MMR = k * factor
     }
-    
+
+    # BÚSQUEDA LÉXICA (BM25) E HÍBRIDA (fusión RRF léxica + vectorial)
+    lexical_params = {
+        "mode": os.getenv("RETRIEVAL_MODE", "dense"),  # dense | hybrid | lexical
+        "k1": 1.5,
+        "b": 0.75,
+        "rrf_k": 60,  # Constante de RRF: 1 / (rrf_k + rank)
+        "candidate_factor": 4,  # Candidatos por ranking = k * candidate_factor
+        # Híbrido: queries de hasta N términos con coincidencias léxicas ("VPN", "T008")
+        # se resuelven solo con BM25, sin embeber la query
+        "fast_path_max_terms": 2
+    }
+
     # DOCUMENTOS (se añaden progresivamente)
     documents = {
         Module.BASICS: ["company_handbook.pdf"],
@@ -73,6 +101,89 @@ class RAGMasterConfig:
         Module.PRODUCTION: ["company_handbook.pdf", "technical_docs.pdf", "faqs.json", "support_tickets.csv"]
     }
     
+    # INGESTA
+    ingestion_params = {
+        "pdf_workers": int(os.getenv("PDF_WORKERS", "1")),  # >1 activa extracción paralela
+        "pdf_pages_per_task": 16,
+        "text_block_size": 1 << 20,  # Caracteres por bloque al leer texto plano
+        "index_batch_size": 100,
+        # Ingesta incremental: reabrir colecciones y saltar documentos sin cambios
+        "incremental": os.getenv("INCREMENTAL_INGEST", "false").lower() == "true",
+        "manifest_dir": "data/.ingest",
+        # Deduplicación MinHash/LSH de chunks casi idénticos antes de indexar
+        "dedup": {"enabled": True, "threshold": 0.85, "num_perm": 128, "bands": 32,
+                  "shingle_size": 5},
+        # Etiquetas en paralelo (procesos) solo para listas de al menos feature_parallel_min
+        "feature_workers": int(os.getenv("FEATURE_WORKERS", "1")),  # >1 activa el pool
+        "feature_parallel_min": 5000,
+        # Etiquetas booleanas de metadatos (regex, sin distinguir mayúsculas)
+        "metadata_tags": {
+            "has_numbers": r"\d",
+            "has_policy": r"pol[ií]tica|policy",
+            "has_benefits": r"beneficio|benefit"
+        }
+    }
+
+    # ALMACENAMIENTO (índice persistente en disco con arranque en caliente)
+    storage_params = {
+        "persistent": os.getenv("CHROMA_PERSIST", "false").lower() == "true",
+        "persist_directory": os.getenv("CHROMA_PERSIST_DIRECTORY", "data/vectordb"),
+        # Cache persistente de embeddings (SQLite), clave (modelo, sha256(texto))
+        "embedding_cache_path": os.getenv("EMBEDDING_CACHE_PATH", "data/.cache/embeddings.sqlite"),
+        "embedding_cache_max_entries": 200_000,
+        # Backends locales: guardar índice + checkpoint cada N lotes indexados
+        "persist_every_batches": 10,
+        # Snapshots de solo lectura mapeados en memoria (compartidos entre procesos)
+        "snapshot_dir": os.getenv("RAG_SNAPSHOT_DIR", "data/snapshots"),
+        "snapshot_dtype": "float32"  # float16 reduce a la mitad el tamaño
+    }
+
+    # ÍNDICES VECTORIALES LOCALES (cuando VECTOR_DB no es chromadb)
+    vector_index_params = {
+        "faiss": {
+            "index_type": os.getenv("FAISS_INDEX_TYPE", "flat"),  # flat | ivf | hnsw
+            "nlist": 1024,  # IVF: listas invertidas
+            "nprobe": 16,  # IVF: listas visitadas por query (recall vs latencia)
+            "train_factor": 39,  # IVF: se entrena al llegar a train_factor * nlist vectores
+            "hnsw_m": 32,
+            "ef_construction": 200,
+            "ef_search": 64,  # HNSW: amplitud de búsqueda (recall vs latencia)
+            "rebuild_ratio": 0.25  # HNSW: reconstruir con este % de borrados
+        },
+        # Búsqueda exacta en memoria: ideal para corpus pequeños (miles de chunks)
+        "numpy": {
+            "dtype": os.getenv("NUMPY_VECTOR_DTYPE", "float16"),  # float16 | float32
+            "block_rows": 65536  # Filas por bloque de matmul (acota la memoria temporal)
+        },
+        # Códigos comprimidos en RAM + vectores float32 en disco para re-scoring exacto
+        "quantized": {
+            "mode": os.getenv("VECTOR_QUANTIZATION", "int8"),  # int8 (4x) | pq (16x)
+            "pq_m": None,  # Subvectores PQ (None = dim / 4)
+            "train_size": 10000,  # Vectores para entrenar (PQ: ~39 por centroide de 256)
+            "rescore_factor": 10,  # Candidatos re-puntuados = k * rescore_factor
+            "min_candidates": 50
+        },
+        # Índice particionado por hash del ID con búsqueda scatter-gather
+        "sharded": {
+            "num_shards": int(os.getenv("VECTOR_SHARDS", "4")),
+            "shard_backend": os.getenv("SHARD_BACKEND", "numpy"),  # numpy | faiss | quantized
+            "executor": os.getenv("SHARD_EXECUTOR", "thread")  # thread | process
+        }
+    }
+
+    # EMBEDDINGS (un único embedder para Chroma, LangChain y LlamaIndex)
+    embedding_params = {
+        "backend": os.getenv("EMBEDDING_BACKEND", "openai"),  # openai | hash (local, offline)
+        "batch_size": 100,  # Textos por llamada
+        "concurrency": int(os.getenv("EMBEDDING_CONCURRENCY", "4")),  # Llamadas en paralelo
+        "hash_dim": 256,
+        # Matryoshka: indexar y buscar con las primeras N dimensiones (None = completas)
+        "dimensions": int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+        # Dos etapas: pasada gruesa con vectores recortados y re-ranking con completos
+        "two_stage": os.getenv("EMBEDDING_TWO_STAGE", "false").lower() == "true",
+        "coarse_factor": 5  # Candidatos de la pasada gruesa = k * coarse_factor
+    }
+
     # MÉTRICAS TARGET
     target_metrics = {
         Module.BASICS: {"latency": 2000, "cost": 0.01, "accuracy": 0.7},
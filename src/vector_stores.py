@@ -0,0 +1,1375 @@
+"""
+Vector stores locales del Workshop RAG
+Backends alternativos a ChromaDB con la misma API de colección
+(add / upsert / update / get / delete / query / count / peek)
+"""
+
+import os
+import json
+import time
+import zlib
+import heapq
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from typing import List, Dict, Optional, Any, Tuple, Iterator
+
+import numpy as np
+
+# FAISS para índices aproximados (opcional)
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+
+def _matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Filtro `where` estilo Chroma: igualdad, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte, $and/$or"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+    return True
+
+
+class LocalCollection:
+    """
+    Colección local compatible con la API de Chroma que usan los módulos
+    Guarda ids, documentos y metadatos en un side-store indexado por fila;
+    las subclases implementan el índice vectorial (_index_*)
+    Distancias: L2 al cuadrado, igual que el espacio por defecto de Chroma
+    """
+
+    def __init__(self, name: str, embedding_function, path: Optional[str] = None):
+        self.name = name
+        self.embedding_function = embedding_function
+        self.path = path
+
+        self._rows: Dict[str, int] = {}
+        self._ids: Dict[int, str] = {}
+        self._documents: Dict[int, str] = {}
+        self._metadatas: Dict[int, Dict[str, Any]] = {}
+        self._next_row = 0
+        self._dirty = False
+
+        if path and os.path.exists(os.path.join(path, "store.json")):
+            self._load()
+
+    # ============= ÍNDICE (subclases) =============
+
+    def _index_add(self, rows: np.ndarray, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def _index_remove(self, rows: np.ndarray):
+        raise NotImplementedError
+
+    def _index_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(distancias, filas) de forma (n_queries, k); fila -1 = sin resultado"""
+        raise NotImplementedError
+
+    def _index_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Vectores guardados (float32) de las filas dadas"""
+        raise NotImplementedError
+
+    def _index_save(self, path: str):
+        raise NotImplementedError
+
+    def _index_load(self, path: str):
+        raise NotImplementedError
+
+    # ============= API ESTILO CHROMA =============
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def add(self, ids: List[str], documents: List[str] = None,
+            metadatas: List[Dict[str, Any]] = None, embeddings: List[Any] = None):
+        """Añadir (los IDs ya existentes se ignoran, como en Chroma)"""
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._rows]
+        if keep:
+            self._write(*self._select(keep, ids, documents, metadatas, embeddings))
+
+    def upsert(self, ids: List[str], documents: List[str] = None,
+               metadatas: List[Dict[str, Any]] = None, embeddings: List[Any] = None):
+        existing = [chunk_id for chunk_id in ids if chunk_id in self._rows]
+        if existing:
+            self.delete(ids=existing)
+        self._write(ids, documents, metadatas, embeddings)
+
+    def update(self, ids: List[str], documents: List[str] = None,
+               metadatas: List[Dict[str, Any]] = None, embeddings: List[Any] = None):
+        """Actualizar IDs existentes; sin documentos ni embeddings no se re-embebe"""
+        if documents is not None or embeddings is not None:
+            rows = [self._rows[chunk_id] for chunk_id in ids]
+            documents = documents or [self._documents[row] for row in rows]
+            metadatas = [{**self._metadatas[row], **(metadatas[i] if metadatas else {})}
+                         for i, row in enumerate(rows)]
+            self.upsert(ids, documents, metadatas, embeddings)
+            return
+        for chunk_id, metadata in zip(ids, metadatas or []):
+            row = self._rows[chunk_id]
+            self._metadatas[row] = {**self._metadatas[row], **metadata}
+        self._dirty = True
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None,
+            limit: int = None, offset: int = None,
+            include: List[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        if ids is not None:
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        else:
+            rows = list(self._ids)
+        rows = [row for row in rows if _matches(self._metadatas[row], where)]
+        rows = rows[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._result(rows, include)
+
+    def iter_pages(self, page_size: int = 1000,
+                   include: List[str] = ("documents", "metadatas")) -> Iterator[Dict[str, Any]]:
+        """Exportar la colección por páginas en una sola pasada (get con offset recorre todo)"""
+        rows = list(self._ids)
+        for start in range(0, len(rows), page_size):
+            yield self._result(rows[start:start + page_size], include)
+
+    def peek(self, limit: int = 10) -> Dict[str, Any]:
+        return self.get(limit=limit)
+
+    def delete(self, ids: List[str] = None, where: Dict[str, Any] = None):
+        if ids is None:
+            ids = self.get(where=where, include=[])["ids"]
+        rows = [self._rows.pop(chunk_id) for chunk_id in ids if chunk_id in self._rows]
+        if not rows:
+            return
+        for row in rows:
+            del self._ids[row]
+            del self._documents[row]
+            del self._metadatas[row]
+        self._index_remove(np.asarray(rows, dtype=np.int64))
+        self._dirty = True
+
+    def query(self, query_texts: List[str] = None, query_embeddings: List[Any] = None,
+              n_results: int = 10, where: Dict[str, Any] = None,
+              include: List[str] = ("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if "embeddings" in include:
+            results["embeddings"] = []
+        if not self._rows:
+            for _ in range(len(queries)):
+                for key in results:
+                    results[key].append([])
+            return results
+
+        # Con filtro se piden más candidatos y se filtra después
+        fetch = n_results if not where else max(n_results * 10, 100)
+        distances, rows = self._index_search(queries, min(fetch, self.count()))
+
+        for query_distances, query_rows in zip(distances, rows):
+            hits = [(float(d), int(r)) for d, r in zip(query_distances, query_rows)
+                    if r >= 0 and int(r) in self._ids
+                    and _matches(self._metadatas[int(r)], where)][:n_results]
+            results["ids"].append([self._ids[r] for _, r in hits])
+            results["documents"].append([self._documents[r] for _, r in hits])
+            results["metadatas"].append([self._metadatas[r] for _, r in hits])
+            results["distances"].append([d for d, _ in hits])
+            if "embeddings" in include:
+                results["embeddings"].append(self._vectors([r for _, r in hits]))
+        return results
+
+    # ============= PERSISTENCIA =============
+
+    def persist(self):
+        """Guardar índice y side-store en disco (no-op en memoria o sin cambios)"""
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._index_save(self.path)
+
+        store = {
+            "next_row": self._next_row,
+            "rows": [[row, self._ids[row], self._documents[row], self._metadatas[row]]
+                     for row in self._ids]
+        }
+        store_path = os.path.join(self.path, "store.json")
+        tmp_path = f"{store_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(store, f, ensure_ascii=False)
+        os.replace(tmp_path, store_path)
+        self._dirty = False
+
+    def _load(self):
+        with open(os.path.join(self.path, "store.json"), encoding="utf-8") as f:
+            store = json.load(f)
+        self._next_row = store["next_row"]
+        for row, chunk_id, document, metadata in store["rows"]:
+            self._rows[chunk_id] = row
+            self._ids[row] = chunk_id
+            self._documents[row] = document
+            self._metadatas[row] = metadata
+        self._index_load(self.path)
+
+    # ============= AUXILIARES =============
+
+    def _write(self, ids, documents, metadatas, embeddings):
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        rows = np.arange(self._next_row, self._next_row + len(ids), dtype=np.int64)
+        self._next_row += len(ids)
+
+        for i, (row, chunk_id) in enumerate(zip(rows.tolist(), ids)):
+            self._rows[chunk_id] = row
+            self._ids[row] = chunk_id
+            self._documents[row] = documents[i] if documents else None
+            self._metadatas[row] = metadatas[i] if metadatas else {}
+        self._index_add(rows, vectors)
+        self._dirty = True
+
+    @staticmethod
+    def _select(positions, *columns):
+        return tuple(None if column is None else [column[i] for i in positions]
+                     for column in columns)
+
+    def _vectors(self, rows: List[int]) -> np.ndarray:
+        """Matriz (n, dim) de embeddings, como include=["embeddings"] en Chroma"""
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._index_vectors(np.asarray(rows, dtype=np.int64))
+
+    def _result(self, rows: List[int], include) -> Dict[str, Any]:
+        result = {"ids": [self._ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self._vectors(rows)
+        return result
+
+
+class FaissCollection(LocalCollection):
+    """
+    Colección sobre FAISS con índice Flat (exacto), IVF o HNSW
+    - IVF: hasta tener train_factor * nlist vectores se usa búsqueda exacta;
+      después se entrena y migra el índice
+    - HNSW: no admite borrado; las filas borradas se filtran en la búsqueda
+      y el grafo se reconstruye cuando superan rebuild_ratio
+    """
+
+    def __init__(self, name: str, embedding_function, path: Optional[str] = None,
+                 index_type: str = "flat", nlist: int = 1024, nprobe: int = 16,
+                 train_factor: int = 39, hnsw_m: int = 32, ef_construction: int = 200,
+                 ef_search: int = 64, rebuild_ratio: float = 0.25):
+        if not FAISS_AVAILABLE:
+            raise ImportError("FAISS no está instalado. Instala con: pip install faiss-cpu")
+        if index_type not in ("flat", "ivf", "hnsw"):
+            raise ValueError(f"Tipo de índice FAISS no soportado: {index_type}")
+
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_factor = train_factor
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.rebuild_ratio = rebuild_ratio
+
+        self.index = None
+        self.trained = False  # IVF ya entrenado
+        self._tombstones = set()
+        super().__init__(name, embedding_function, path)
+
+    def _new_index(self, dim: int):
+        if self.index_type == "hnsw":
+            base = faiss.IndexHNSWFlat(dim, self.hnsw_m)
+            base.hnsw.efConstruction = self.ef_construction
+            base.hnsw.efSearch = self.ef_search
+        else:
+            base = faiss.IndexFlatL2(dim)
+        return faiss.IndexIDMap2(base)
+
+    def _index_add(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.index is None:
+            self.index = self._new_index(vectors.shape[1])
+        self.index.add_with_ids(vectors, rows)
+
+        if (self.index_type == "ivf" and not self.trained
+                and self.index.ntotal >= self.train_factor * self.nlist):
+            self._train_ivf()
+
+    def _train_ivf(self):
+        """Migrar de Flat a IVF entrenado con los vectores actuales"""
+        rows, vectors = self._live_vectors()
+        quantizer = faiss.IndexFlatL2(vectors.shape[1])
+        ivf = faiss.IndexIVFFlat(quantizer, vectors.shape[1], self.nlist)
+        ivf.train(vectors)
+        ivf.add_with_ids(vectors, rows)
+        ivf.nprobe = self.nprobe
+        # Mapa id -> posición para reconstruir vectores por fila (se guarda con el índice)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        self.index = ivf
+        self.trained = True
+        print(f"🧭 Índice IVF entrenado ({self.nlist} listas, {len(rows)} vectores)")
+
+    def _live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Filas y vectores vivos de un índice IDMap2 (Flat o HNSW)"""
+        rows = faiss.vector_to_array(self.index.id_map)
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        if self._tombstones:
+            alive = np.isin(rows, list(self._tombstones), invert=True)
+            rows, vectors = rows[alive], vectors[alive]
+        return rows, vectors
+
+    def _index_remove(self, rows: np.ndarray):
+        if self.index is None:
+            return
+        if self.index_type == "hnsw":
+            self._tombstones.update(rows.tolist())
+            if len(self._tombstones) > self.rebuild_ratio * max(self.index.ntotal, 1):
+                self._rebuild()
+            return
+        self.index.remove_ids(rows)
+
+    def _rebuild(self):
+        """Reconstruir el grafo HNSW sin las filas borradas"""
+        rows, vectors = self._live_vectors()
+        self.index = self._new_index(self.index.d)
+        if len(rows):
+            self.index.add_with_ids(vectors, rows)
+        self._tombstones.clear()
+
+    def _index_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        fetch = min(k + len(self._tombstones), self.index.ntotal)
+        distances, rows = self.index.search(queries, fetch)
+        if self._tombstones:
+            rows = np.where(np.isin(rows, list(self._tombstones)), -1, rows)
+        return distances, rows
+
+    def _index_vectors(self, rows: np.ndarray) -> np.ndarray:
+        return np.vstack([self.index.reconstruct(int(row)) for row in rows])
+
+    def _index_save(self, path: str):
+        if self.index is None:
+            return
+        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "faiss.json"), "w") as f:
+            json.dump({"index_type": self.index_type, "trained": self.trained,
+                       "tombstones": sorted(self._tombstones)}, f)
+
+    def _index_load(self, path: str):
+        if not os.path.exists(os.path.join(path, "faiss.json")):
+            return
+        with open(os.path.join(path, "faiss.json")) as f:
+            state = json.load(f)
+        if state["index_type"] != self.index_type:
+            raise ValueError(f"El índice en {path} es {state['index_type']}, "
+                             f"no {self.index_type}")
+        self.index = faiss.read_index(os.path.join(path, "index.faiss"))
+        self.trained = state["trained"]
+        self._tombstones = set(state["tombstones"])
+        if self.trained:
+            self.index.nprobe = self.nprobe
+            self.index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        elif self.index_type == "hnsw":
+            faiss.downcast_index(self.index.index).hnsw.efSearch = self.ef_search
+
+
+class NumpyCollection(LocalCollection):
+    """
+    Búsqueda exacta en proceso sobre una matriz NumPy contigua (float16 o float32)
+    Una multiplicación de matrices + argpartition por bloque de filas; sirve
+    queries sueltas y en batch sin overhead de base de datos
+    """
+
+    def __init__(self, name: str, embedding_function, path: Optional[str] = None,
+                 dtype: str = "float16", block_rows: int = 65536):
+        self.dtype = np.dtype(dtype)
+        self.block_rows = block_rows
+        self._matrix = None  # (capacidad, dim), filas [0, _size) en uso
+        self._norms = np.zeros(0, dtype=np.float32)  # ||x||² por posición
+        self._row_ids = np.zeros(0, dtype=np.int64)  # posición -> fila del side-store
+        self._positions: Dict[int, int] = {}  # fila -> posición
+        self._size = 0
+        super().__init__(name, embedding_function, path)
+
+    def _reserve(self, extra: int, dim: int):
+        """Crecimiento geométrico de la matriz para añadir en O(1) amortizado"""
+        needed = self._size + extra
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        matrix = np.zeros((capacity, dim), dtype=self.dtype)
+        norms = np.zeros(capacity, dtype=np.float32)
+        row_ids = np.zeros(capacity, dtype=np.int64)
+        if self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+            norms[:self._size] = self._norms[:self._size]
+            row_ids[:self._size] = self._row_ids[:self._size]
+        self._matrix, self._norms, self._row_ids = matrix, norms, row_ids
+
+    def _index_add(self, rows: np.ndarray, vectors: np.ndarray):
+        self._reserve(len(rows), vectors.shape[1])
+        end = self._size + len(rows)
+        self._matrix[self._size:end] = vectors
+        # Normas de los vectores ya redondeados al dtype de almacenamiento
+        stored = self._matrix[self._size:end].astype(np.float32)
+        self._norms[self._size:end] = np.einsum("ij,ij->i", stored, stored)
+        self._row_ids[self._size:end] = rows
+        for position, row in enumerate(rows.tolist(), start=self._size):
+            self._positions[row] = position
+        self._size = end
+
+    def _index_remove(self, rows: np.ndarray):
+        """Borrado O(1) por fila: se mueve la última posición al hueco"""
+        for row in rows.tolist():
+            position = self._positions.pop(row)
+            last = self._size - 1
+            if position != last:
+                moved = int(self._row_ids[last])
+                self._matrix[position] = self._matrix[last]
+                self._norms[position] = self._norms[last]
+                self._row_ids[position] = moved
+                self._positions[moved] = position
+            self._size = last
+
+    def _index_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        distances, positions = _blocked_top_k(self._matrix, self._norms, self._size,
+                                              queries, k, self.block_rows)
+        return distances, self._row_ids[positions]
+
+    def _index_vectors(self, rows: np.ndarray) -> np.ndarray:
+        positions = [self._positions[row] for row in rows.tolist()]
+        return self._matrix[positions].astype(np.float32)
+
+    def _index_save(self, path: str):
+        np.save(os.path.join(path, "vectors.npy"), self._matrix[:self._size]
+                if self._matrix is not None else np.zeros((0, 0), dtype=self.dtype))
+        np.save(os.path.join(path, "rows.npy"), self._row_ids[:self._size])
+
+    def _index_load(self, path: str):
+        vectors_path = os.path.join(path, "vectors.npy")
+        if not os.path.exists(vectors_path):
+            return
+        vectors = np.load(vectors_path).astype(self.dtype, copy=False)
+        rows = np.load(os.path.join(path, "rows.npy"))
+        if len(rows):
+            self._index_add(rows, vectors)
+
+
+def _exact_top_k(vectors: np.ndarray, rows: np.ndarray, queries: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k exacto (L2²) de queries contra vectors; devuelve (distancias, filas)"""
+    k = min(k, len(rows))
+    distances = ((vectors ** 2).sum(axis=1)[None, :] + (queries ** 2).sum(axis=1)[:, None]
+                 - 2 * (queries @ vectors.T))
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    top_distances = np.take_along_axis(distances, top, axis=1)
+    order = np.argsort(top_distances, axis=1)
+    return (np.maximum(np.take_along_axis(top_distances, order, axis=1), 0),
+            rows[np.take_along_axis(top, order, axis=1)])
+
+
+def _blocked_top_k(matrix: np.ndarray, norms: np.ndarray, size: int, queries: np.ndarray,
+                   k: int, block_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k exacto (L2²) sobre las primeras `size` filas de una matriz (float16/32,
+    en RAM o mapeada). Un matmul + argpartition por bloque de filas y fusión de
+    los mejores de cada bloque. Devuelve (distancias, posiciones) (n_queries, k)
+    """
+    queries = queries.astype(np.float32, copy=False)
+    query_norms = np.einsum("ij,ij->i", queries, queries)
+    best_distances = best_positions = None
+
+    for start in range(0, size, block_rows):
+        end = min(start + block_rows, size)
+        block = np.asarray(matrix[start:end], dtype=np.float32)
+        # ||x - q||² = ||x||² + ||q||² - 2 x·q  -> (filas del bloque, queries)
+        distances = norms[start:end, None] + query_norms[None, :] - 2 * (block @ queries.T)
+
+        block_k = min(k, end - start)
+        top = np.argpartition(distances, block_k - 1, axis=0)[:block_k]
+        top_distances = np.take_along_axis(distances, top, axis=0)
+        top += start
+
+        if best_distances is None:
+            best_distances, best_positions = top_distances, top
+        else:
+            # Fusionar con los mejores de bloques anteriores
+            merged_distances = np.vstack([best_distances, top_distances])
+            merged_positions = np.vstack([best_positions, top])
+            merged_k = min(k, len(merged_distances))
+            keep = np.argpartition(merged_distances, merged_k - 1, axis=0)[:merged_k]
+            best_distances = np.take_along_axis(merged_distances, keep, axis=0)
+            best_positions = np.take_along_axis(merged_positions, keep, axis=0)
+
+    order = np.argsort(best_distances, axis=0)
+    best_distances = np.maximum(np.take_along_axis(best_distances, order, axis=0), 0)
+    best_positions = np.take_along_axis(best_positions, order, axis=0)
+    return best_distances.T, best_positions.T
+
+
+class FullPrecisionStore:
+    """
+    Vectores float32 en disco (memmap) indexados por fila
+    Solo se leen las filas candidatas al re-scoring: no ocupan RAM del proceso
+    """
+
+    def __init__(self, filepath: str, dim: Optional[int] = None, capacity: int = 0):
+        self.filepath = filepath
+        self.dim = dim
+        self.capacity = 0
+        self.vectors = None
+        if dim and capacity:
+            self._open(capacity)
+
+    def _open(self, capacity: int):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.filepath, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.filepath, dtype=np.float32, mode="r+",
+                                 shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    def write(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        needed = int(rows.max()) + 1
+        if needed > self.capacity:
+            self._open(max(needed, self.capacity * 2, 1024))
+        self.vectors[rows] = vectors
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self.vectors[rows])
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+
+
+class ChunkVectorStore:
+    """
+    Vectores completos (float32) por chunk ID sobre un FullPrecisionStore
+    Para el re-ranking en dos etapas: se escriben al indexar y en la query se
+    leen por ID, sin volver a embeber. Las filas de los chunks borrados se reutilizan
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        # Sin path, los vectores van a un directorio temporal
+        self._tmpdir = None if path else tempfile.TemporaryDirectory(prefix="rag_full_vectors_")
+        self.path = path or self._tmpdir.name
+        os.makedirs(self.path, exist_ok=True)
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+
+        dim, capacity = None, 0
+        state_path = os.path.join(self.path, "rows.json")
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            self._rows, self._free = state["rows"], state["free"]
+            dim, capacity = state["dim"], state["capacity"]
+        self.store = FullPrecisionStore(os.path.join(self.path, "vectors.f32"), dim, capacity)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def put(self, ids: List[str], vectors: np.ndarray):
+        rows = []
+        for chunk_id in ids:
+            row = self._rows.get(chunk_id)
+            if row is None:
+                # Filas asignadas = en uso + libres: la siguiente nueva es su total
+                row = self._free.pop() if self._free else len(self._rows) + len(self._free)
+                self._rows[chunk_id] = row
+            rows.append(row)
+        if rows:
+            self.store.write(np.asarray(rows, dtype=np.int64),
+                             np.asarray(vectors, dtype=np.float32))
+
+    def get(self, ids: List[str]) -> List[Optional[np.ndarray]]:
+        """Vector de cada ID (None si no está guardado), en una sola lectura"""
+        found = [i for i, chunk_id in enumerate(ids) if chunk_id in self._rows]
+        result: List[Optional[np.ndarray]] = [None] * len(ids)
+        if found:
+            rows = np.asarray([self._rows[ids[i]] for i in found], dtype=np.int64)
+            for i, vector in zip(found, self.store.read(rows)):
+                result[i] = vector
+        return result
+
+    def delete(self, ids: List[str]):
+        for chunk_id in ids:
+            row = self._rows.pop(chunk_id, None)
+            if row is not None:
+                self._free.append(row)
+
+    def clear(self):
+        """Vaciar (p. ej. al cambiar de modelo: la dimensión puede ser otra)"""
+        self._rows, self._free = {}, []
+        self.store.vectors = None
+        if os.path.exists(self.store.filepath):
+            os.remove(self.store.filepath)
+        self.store = FullPrecisionStore(self.store.filepath)
+        self.persist()
+
+    def persist(self):
+        self.store.flush()
+        state_path = os.path.join(self.path, "rows.json")
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"rows": self._rows, "free": self._free, "dim": self.store.dim,
+                       "capacity": self.store.capacity}, f)
+        os.replace(tmp_path, state_path)
+
+
+class QuantizedCollection(LocalCollection):
+    """
+    Almacenamiento comprimido de embeddings con re-scoring exacto
+    - int8: cuantización escalar por dimensión (4x menos memoria)
+    - pq: product quantization, pq_m subvectores de 8 bits (d*4/pq_m x menos)
+    Pasada aproximada sobre los códigos (FAISS) y re-scoring de los
+    k * rescore_factor mejores candidatos con los vectores float32 en disco.
+    Hasta reunir train_size vectores para entrenar, la búsqueda es exacta
+    """
+
+    def __init__(self, name: str, embedding_function, path: Optional[str] = None,
+                 mode: str = "int8", pq_m: Optional[int] = None, train_size: int = 10000,
+                 rescore_factor: int = 10, min_candidates: int = 50):
+        if not FAISS_AVAILABLE:
+            raise ImportError("FAISS no está instalado. Instala con: pip install faiss-cpu")
+        if mode not in ("int8", "pq"):
+            raise ValueError(f"Modo de cuantización no soportado: {mode}")
+
+        self.mode = mode
+        self.pq_m = pq_m
+        self.train_size = train_size
+        self.rescore_factor = rescore_factor
+        self.min_candidates = min_candidates
+        self.index = None  # None hasta entrenar el cuantizador
+
+        # Sin path, los vectores completos van a un directorio temporal
+        self._tmpdir = None if path else tempfile.TemporaryDirectory(prefix="rag_vectors_")
+        store_dir = path or self._tmpdir.name
+        os.makedirs(store_dir, exist_ok=True)
+        self.store = FullPrecisionStore(os.path.join(store_dir, "vectors.f32"))
+        super().__init__(name, embedding_function, path)
+
+    def _new_index(self, dim: int):
+        if self.mode == "int8":
+            base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+        else:
+            # Mayor divisor de dim que no supere dim/4 (16x de compresión por defecto)
+            target = self.pq_m or max(1, dim // 4)
+            m = max(divisor for divisor in range(1, target + 1) if dim % divisor == 0)
+            base = faiss.IndexPQ(dim, m, 8)
+        return faiss.IndexIDMap2(base)
+
+    def _live_rows(self) -> np.ndarray:
+        return np.fromiter(self._ids, dtype=np.int64, count=len(self._ids))
+
+    def _index_add(self, rows: np.ndarray, vectors: np.ndarray):
+        self.store.write(rows, vectors)
+        if self.index is not None:
+            self.index.add_with_ids(vectors, rows)
+        elif self.count() >= self.train_size:
+            self._train()
+
+    def _train(self):
+        rows = self._live_rows()
+        vectors = self.store.read(rows)
+        self.index = self._new_index(vectors.shape[1])
+        self.index.train(vectors)
+        self.index.add_with_ids(vectors, rows)
+        stats = self.memory_stats()
+        print(f"🗜️ Cuantizador {self.mode} entrenado con {len(rows)} vectores "
+              f"({stats['compression']:.0f}x menos memoria)")
+
+    def _index_remove(self, rows: np.ndarray):
+        if self.index is not None:
+            self.index.remove_ids(rows)
+
+    def _index_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = queries.astype(np.float32, copy=False)
+        if self.index is None:
+            rows = self._live_rows()
+            return _exact_top_k(self.store.read(rows), rows, queries, k)
+
+        # Pasada aproximada sobre los códigos comprimidos
+        candidates = min(max(k * self.rescore_factor, self.min_candidates), self.index.ntotal)
+        _, candidate_rows = self.index.search(queries, candidates)
+
+        # Re-scoring exacto de los candidatos con los vectores completos
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query_rows in enumerate(candidate_rows):
+            query_rows = query_rows[query_rows >= 0]
+            if len(query_rows):
+                top_distances, top_rows = _exact_top_k(
+                    self.store.read(query_rows), query_rows, queries[i:i + 1], k)
+                distances[i, :top_rows.shape[1]] = top_distances[0]
+                rows[i, :top_rows.shape[1]] = top_rows[0]
+        return distances, rows
+
+    def _index_vectors(self, rows: np.ndarray) -> np.ndarray:
+        return self.store.read(rows)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Memoria de los códigos en RAM frente a float32 sin comprimir"""
+        count = self.count()
+        dim = self.store.dim or 0
+        full_bytes = count * dim * 4
+        if self.index is None:
+            code_bytes = full_bytes  # Sin entrenar se busca sobre los vectores completos
+        else:
+            code_bytes = count * faiss.downcast_index(self.index.index).sa_code_size()
+        return {
+            "mode": self.mode,
+            "vectors": count,
+            "float32_bytes": full_bytes,
+            "code_bytes": code_bytes,
+            "compression": full_bytes / code_bytes if code_bytes else 1.0
+        }
+
+    def _index_save(self, path: str):
+        self.store.flush()
+        if self.index is not None:
+            faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "quantized.json"), "w") as f:
+            json.dump({"mode": self.mode, "dim": self.store.dim,
+                       "capacity": self.store.capacity,
+                       "trained": self.index is not None}, f)
+
+    def _index_load(self, path: str):
+        state_path = os.path.join(path, "quantized.json")
+        if not os.path.exists(state_path):
+            return
+        with open(state_path) as f:
+            state = json.load(f)
+        if state["mode"] != self.mode:
+            raise ValueError(f"El índice en {path} es {state['mode']}, no {self.mode}")
+        self.store = FullPrecisionStore(os.path.join(path, "vectors.f32"),
+                                        state["dim"], state["capacity"])
+        if state["trained"]:
+            self.index = faiss.read_index(os.path.join(path, "index.faiss"))
+
+
+def benchmark_quantization(vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                           modes: Tuple[str, ...] = ("int8", "pq"),
+                           **params) -> Dict[str, Dict[str, Any]]:
+    """
+    Comparar memoria y recall@k de los modos comprimidos frente a búsqueda exacta
+    Reporta recall con y sin re-scoring y latencia media por query
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+    _, truth = _exact_top_k(vectors, np.arange(len(vectors)), queries, k)
+
+    def recall(found: np.ndarray) -> float:
+        return float(np.mean([len(set(f[f >= 0]) & set(t)) / len(t)
+                              for f, t in zip(found, truth)]))
+
+    report = {"float32": {"bytes": vectors.nbytes, "compression": 1.0, "recall": 1.0}}
+    for mode in modes:
+        collection = QuantizedCollection(f"bench_{mode}", None, mode=mode,
+                                         train_size=len(vectors), **params)
+        collection.add(ids=ids, documents=ids, embeddings=vectors)
+
+        _, approximate = collection.index.search(queries, k)
+        start = time.perf_counter()
+        _, rescored = collection._index_search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        stats = collection.memory_stats()
+        report[mode] = {
+            "bytes": stats["code_bytes"],
+            "compression": stats["compression"],
+            "recall_approximate": recall(approximate),
+            "recall": recall(rescored),
+            "latency_ms": latency_ms
+        }
+    return report
+
+
+# ============= ÍNDICE PARTICIONADO (SHARDS) =============
+
+def _shard_worker(conn, backend: str, name: str, path: Optional[str], params: Dict[str, Any]):
+    """Proceso de un shard: ejecuta las llamadas que recibe sobre su colección"""
+    collection = LocalVectorClient.BACKENDS[backend](name, None, path, **params)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        method, kwargs = message
+        try:
+            conn.send((True, getattr(collection, method)(**kwargs)))
+        except Exception as error:
+            conn.send((False, error))
+    conn.close()
+
+
+class _ProcessShard:
+    """
+    Shard servido por un proceso local; las llamadas viajan por un Pipe
+    El Pipe es uno por shard: quien envía debe tener `lock` hasta leer su
+    respuesta, o dos hilos (p. ej. el pipeline de indexación) se cruzan las respuestas
+    """
+
+    def __init__(self, backend: str, name: str, path: Optional[str], params: Dict[str, Any]):
+        context = multiprocessing.get_context("spawn")
+        self.lock = threading.Lock()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_shard_worker, daemon=True,
+                                       args=(child_conn, backend, name, path, params))
+        self.process.start()
+        child_conn.close()
+
+    def submit(self, method: str, kwargs: Dict[str, Any]):
+        self.conn.send((method, kwargs))
+
+    def result(self):
+        ok, value = self.conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def close(self):
+        if self.process.is_alive():
+            with self.lock:
+                self.conn.send(None)
+            self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ShardedCollection:
+    """
+    Colección particionada por hash del ID en N shards (numpy, faiss o quantized)
+    - executor="thread": shards en el proceso, búsqueda en paralelo con hilos
+      (matmul y FAISS liberan el GIL)
+    - executor="process": cada shard en su propio proceso local
+    Los embeddings se calculan una vez aquí; las queries se reparten a todos los
+    shards y sus top-k (ya ordenados) se fusionan con un heap
+    """
+
+    def __init__(self, name: str, embedding_function, path: Optional[str] = None,
+                 num_shards: int = 4, shard_backend: str = "numpy",
+                 executor: str = "thread", shard_params: Dict[str, Any] = None):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Executor de shards no soportado: {executor}")
+        self.name = name
+        self.embedding_function = embedding_function
+        self.path = path
+        self.num_shards = num_shards
+        self.executor = executor
+
+        if path:
+            self._check_layout(path, num_shards, shard_backend)
+        shard_params = shard_params or {}
+        shard_paths = [os.path.join(path, f"shard_{i:03d}") if path else None
+                       for i in range(num_shards)]
+        if executor == "process":
+            self.shards = [_ProcessShard(shard_backend, f"{name}_{i}", shard_path, shard_params)
+                           for i, shard_path in enumerate(shard_paths)]
+            self._pool = None
+        else:
+            shard_class = LocalVectorClient.BACKENDS[shard_backend]
+            self.shards = [shard_class(f"{name}_{i}", None, shard_path, **shard_params)
+                           for i, shard_path in enumerate(shard_paths)]
+            self._pool = ThreadPoolExecutor(max_workers=num_shards)
+
+    @staticmethod
+    def _check_layout(path: str, num_shards: int, shard_backend: str):
+        """El número de shards forma parte del particionado: no puede cambiar"""
+        layout_path = os.path.join(path, "shards.json")
+        layout = {"num_shards": num_shards, "shard_backend": shard_backend}
+        if os.path.exists(layout_path):
+            with open(layout_path) as f:
+                stored = json.load(f)
+            if stored != layout:
+                raise ValueError(f"El índice en {path} tiene {stored}, no {layout}")
+            return
+        os.makedirs(path, exist_ok=True)
+        with open(layout_path, "w") as f:
+            json.dump(layout, f)
+
+    def shard_of(self, chunk_id: str) -> int:
+        return zlib.crc32(chunk_id.encode()) % self.num_shards
+
+    def _fanout(self, method: str, calls: Dict[int, Dict[str, Any]]) -> Dict[int, Any]:
+        """
+        Ejecutar method(**kwargs) en cada shard indicado, en paralelo
+        Se esperan todas las respuestas antes de relanzar el primer error: una
+        respuesta sin leer en el Pipe de un shard contestaría a la llamada siguiente
+        """
+        if self.executor == "process":
+            submitted = []
+            with ExitStack() as stack:
+                # Locks en orden de shard: dos llamadas concurrentes no se bloquean entre sí
+                for shard in sorted(calls):
+                    stack.enter_context(self.shards[shard].lock)
+                try:
+                    for shard, kwargs in calls.items():
+                        self.shards[shard].submit(method, kwargs)
+                        submitted.append(shard)
+                finally:
+                    pending = {shard: self.shards[shard].result for shard in submitted}
+                    results, errors = self._collect(pending)
+        else:
+            futures = {shard: self._pool.submit(getattr(self.shards[shard], method), **kwargs)
+                       for shard, kwargs in calls.items()}
+            results, errors = self._collect(
+                {shard: future.result for shard, future in futures.items()})
+        if errors:
+            raise errors[0]
+        return results
+
+    @staticmethod
+    def _collect(pending: Dict[int, Any]) -> Tuple[Dict[int, Any], List[Exception]]:
+        """Leer el resultado de cada shard sin cortar en el primer error"""
+        results, errors = {}, []
+        for shard, result in pending.items():
+            try:
+                results[shard] = result()
+            except Exception as error:
+                errors.append(error)
+        return results, errors
+
+    def _all_shards(self, method: str, **kwargs) -> Dict[int, Any]:
+        return self._fanout(method, {shard: kwargs for shard in range(self.num_shards)})
+
+    def _partition(self, ids: List[str], **columns) -> Dict[int, Dict[str, Any]]:
+        """Repartir ids (y sus columnas alineadas) por shard"""
+        positions: Dict[int, List[int]] = {}
+        for i, chunk_id in enumerate(ids):
+            positions.setdefault(self.shard_of(chunk_id), []).append(i)
+        calls = {}
+        for shard, shard_positions in positions.items():
+            calls[shard] = {"ids": [ids[i] for i in shard_positions]}
+            for key, values in columns.items():
+                if values is not None:
+                    calls[shard][key] = [values[i] for i in shard_positions]
+        return calls
+
+    # ============= API ESTILO CHROMA =============
+
+    def count(self) -> int:
+        return sum(self._all_shards("count").values())
+
+    def _write(self, method: str, ids, documents, metadatas, embeddings):
+        if embeddings is None and documents is not None:
+            embeddings = self.embedding_function(documents)
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        self._fanout(method, self._partition(ids, documents=documents, metadatas=metadatas,
+                                             embeddings=embeddings))
+
+    def add(self, ids: List[str], documents: List[str] = None,
+            metadatas: List[Dict[str, Any]] = None, embeddings: List[Any] = None):
+        self._write("add", ids, documents, metadatas, embeddings)
+
+    def upsert(self, ids: List[str], documents: List[str] = None,
+               metadatas: List[Dict[str, Any]] = None, embeddings: List[Any] = None):
+        self._write("upsert", ids, documents, metadatas, embeddings)
+
+    def update(self, ids: List[str], documents: List[str] = None,
+               metadatas: List[Dict[str, Any]] = None, embeddings: List[Any] = None):
+        self._write("update", ids, documents, metadatas, embeddings)
+
+    def delete(self, ids: List[str] = None, where: Dict[str, Any] = None):
+        if ids is None:
+            self._all_shards("delete", where=where)
+        else:
+            self._fanout("delete", self._partition(ids))
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None,
+            limit: int = None, offset: int = None,
+            include: List[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        include = list(include)
+        if ids is not None:
+            calls = self._partition(ids)
+            for kwargs in calls.values():
+                kwargs.update(where=where, include=include)
+        else:
+            shard_limit = None if limit is None else (offset or 0) + limit
+            calls = {shard: {"where": where, "limit": shard_limit, "include": include}
+                     for shard in range(self.num_shards)}
+        pages = self._fanout("get", calls)
+
+        result = {key: [] for key in ("ids", *include)
+                  if key in ("ids", "documents", "metadatas", "embeddings")}
+        for shard in sorted(pages):
+            for key in result:
+                result[key].extend(pages[shard][key])
+        if ids is None:
+            end = None if limit is None else (offset or 0) + limit
+            result = {key: values[offset or 0:end] for key, values in result.items()}
+        return result
+
+    def iter_pages(self, page_size: int = 1000,
+                   include: List[str] = ("documents", "metadatas")) -> Iterator[Dict[str, Any]]:
+        """
+        Exportar por páginas: una lectura completa por shard (en memoria solo un
+        shard a la vez), en el mismo orden que get()
+        """
+        for shard in range(self.num_shards):
+            page = self._fanout("get", {shard: {"include": list(include)}})[shard]
+            for start in range(0, len(page["ids"]), page_size):
+                yield {key: values[start:start + page_size] for key, values in page.items()}
+
+    def peek(self, limit: int = 10) -> Dict[str, Any]:
+        return self.get(limit=limit)
+
+    def query(self, query_texts: List[str] = None, query_embeddings: List[Any] = None,
+              n_results: int = 10, where: Dict[str, Any] = None,
+              include: List[str] = ("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+
+        pages = self._all_shards("query", query_embeddings=queries, n_results=n_results,
+                                 where=where, include=include)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if "embeddings" in include:
+            results["embeddings"] = []
+        for q in range(len(queries)):
+            # Fusión k-way de las listas ordenadas de cada shard
+            streams = [[(distance, shard, j) for j, distance in enumerate(page["distances"][q])]
+                       for shard, page in pages.items()]
+            merged = list(islice(heapq.merge(*streams), n_results))
+            for key in results:
+                results[key].append([pages[shard][key][q][j] if key != "distances" else distance
+                                     for distance, shard, j in merged])
+        return results
+
+    # ============= CICLO DE VIDA =============
+
+    def persist(self):
+        if self.path:
+            self._all_shards("persist")
+
+    def close(self):
+        if self.executor == "process":
+            for shard in self.shards:
+                shard.close()
+        else:
+            self._pool.shutdown()
+
+
+# ============= SNAPSHOTS MAPEADOS EN MEMORIA =============
+
+SNAPSHOT_FORMAT = "rag-snapshot"
+SNAPSHOT_VERSION = 1
+_STRING_COLUMNS = ("ids", "documents", "metadatas")
+
+
+class _BlobWriter:
+    """Columna de textos como offsets (int64) + blob UTF-8, escrita en streaming"""
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self.offsets = [0]
+        self.raw_path = os.path.join(path, f"{name}.raw")
+        self.raw = open(self.raw_path, "wb")
+
+    def append(self, text: str):
+        data = text.encode("utf-8")
+        self.raw.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        """Convertir el blob a .npy (uint8) para poder abrirlo con np.load(mmap_mode='r')"""
+        self.raw.close()
+        np.save(os.path.join(self.path, f"{self.name}_offsets.npy"),
+                np.asarray(self.offsets, dtype=np.int64))
+        blob = np.lib.format.open_memmap(os.path.join(self.path, f"{self.name}_blob.npy"),
+                                         mode="w+", dtype=np.uint8, shape=(self.offsets[-1],))
+        with open(self.raw_path, "rb") as raw:
+            position = 0
+            for data in iter(lambda: raw.read(1 << 24), b""):
+                blob[position:position + len(data)] = np.frombuffer(data, dtype=np.uint8)
+                position += len(data)
+        blob.flush()
+        del blob
+        os.remove(self.raw_path)
+
+
+class _BlobColumn:
+    """Lectura perezosa de una columna offsets + blob mapeada en memoria"""
+
+    def __init__(self, path: str, name: str, as_json: bool = False):
+        self.offsets = np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode="r")
+        self.blob = np.load(os.path.join(path, f"{name}_blob.npy"), mmap_mode="r")
+        self.as_json = as_json
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int):
+        text = self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+        return json.loads(text) if self.as_json else text
+
+
+def write_snapshot(path: str, pages, count: int, info: Dict[str, Any] = None,
+                   dtype: str = "float32") -> str:
+    """
+    Escribir un snapshot versionado a partir de páginas (ids, documentos,
+    metadatos, vectores). Layout:
+      manifest.json            formato, versión, nº de filas, dim, dtype, info
+      vectors.npy / norms.npy  matriz de embeddings y ||x||²
+      <columna>_offsets.npy + <columna>_blob.npy   ids, documentos y metadatos
+    Se escribe en un directorio temporal y se sustituye al final: los procesos
+    que tengan mapeado el snapshot anterior siguen leyendo sus ficheros
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=".snapshot_", dir=parent)
+
+    columns = {name: _BlobWriter(tmp_path, name) for name in _STRING_COLUMNS}
+    vectors = norms = None
+    row = 0
+    for ids, documents, metadatas, page_vectors in pages:
+        page_vectors = np.asarray(page_vectors, dtype=np.float32)
+        if vectors is None:
+            dim = page_vectors.shape[1] if len(page_vectors) else 0
+            vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"),
+                                                mode="w+", dtype=dtype, shape=(count, dim))
+            norms = np.lib.format.open_memmap(os.path.join(tmp_path, "norms.npy"),
+                                              mode="w+", dtype=np.float32, shape=(count,))
+        end = row + len(ids)
+        vectors[row:end] = page_vectors
+        stored = np.asarray(vectors[row:end], dtype=np.float32)
+        norms[row:end] = np.einsum("ij,ij->i", stored, stored)
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            columns["ids"].append(chunk_id)
+            columns["documents"].append(document or "")
+            columns["metadatas"].append(json.dumps(metadata or {}, ensure_ascii=False))
+        row = end
+
+    if row != count:
+        shutil.rmtree(tmp_path)
+        raise ValueError(f"El snapshot esperaba {count} filas y recibió {row}")
+    if vectors is None:
+        vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"),
+                                            mode="w+", dtype=dtype, shape=(0, 0))
+        norms = np.lib.format.open_memmap(os.path.join(tmp_path, "norms.npy"),
+                                          mode="w+", dtype=np.float32, shape=(0,))
+    dim = vectors.shape[1]
+    vectors.flush()
+    norms.flush()
+    del vectors, norms
+    for column in columns.values():
+        column.close()
+
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION,
+                   "count": count, "dim": dim, "dtype": dtype,
+                   "created_at": time.time(), **(info or {})}, f, indent=2)
+
+    # Sustituir el snapshot anterior
+    if os.path.exists(path):
+        old_path = f"{tmp_path}.old"
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} no es un snapshot del workshop")
+    if manifest["version"] > SNAPSHOT_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {manifest['version']} "
+                         f"(máxima {SNAPSHOT_VERSION})")
+    return manifest
+
+
+class SnapshotCollection:
+    """
+    Colección de solo lectura sobre un snapshot abierto con np.load(mmap_mode='r')
+    Varios procesos comparten la misma copia a través del page cache del sistema;
+    la búsqueda es exacta (L2²) por bloques sobre la matriz mapeada
+    """
+
+    def __init__(self, path: str, embedding_function, block_rows: int = 65536):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self.embedding_function = embedding_function
+        self.block_rows = block_rows
+        self.manifest = read_snapshot_manifest(path)
+
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self._ids = _BlobColumn(path, "ids")
+        self._documents = _BlobColumn(path, "documents")
+        self._metadatas = _BlobColumn(path, "metadatas", as_json=True)
+        self._rows = None  # id -> fila, se construye en el primer get(ids=...)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _read_only(self, *args, **kwargs):
+        raise PermissionError(f"El snapshot {self.path} es de solo lectura")
+
+    add = upsert = update = delete = _read_only
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None,
+            limit: int = None, offset: int = None,
+            include: List[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        if ids is not None:
+            if self._rows is None:
+                self._rows = {self._ids[row]: row for row in range(self.count())}
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        else:
+            rows = range(self.count())
+        if where:
+            rows = [row for row in rows if _matches(self._metadatas[row], where)]
+        rows = list(rows)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._result(rows, include)
+
+    def iter_pages(self, page_size: int = 1000,
+                   include: List[str] = ("documents", "metadatas")) -> Iterator[Dict[str, Any]]:
+        for start in range(0, self.count(), page_size):
+            yield self._result(list(range(start, min(start + page_size, self.count()))), include)
+
+    def peek(self, limit: int = 10) -> Dict[str, Any]:
+        return self.get(limit=limit)
+
+    def query(self, query_texts: List[str] = None, query_embeddings: List[Any] = None,
+              n_results: int = 10, where: Dict[str, Any] = None,
+              include: List[str] = ("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if "embeddings" in include:
+            results["embeddings"] = []
+        if not self.count():
+            for key in results:
+                results[key].extend([] for _ in range(len(queries)))
+            return results
+
+        fetch = n_results if not where else max(n_results * 10, 100)
+        distances, rows = _blocked_top_k(self.vectors, self.norms, self.count(), queries,
+                                         min(fetch, self.count()), self.block_rows)
+        for query_distances, query_rows in zip(distances, rows.tolist()):
+            hits = [(float(d), r) for d, r in zip(query_distances, query_rows)
+                    if _matches(self._metadatas[r], where)][:n_results]
+            page = self._result([r for _, r in hits], include)
+            results["ids"].append(page["ids"])
+            results["documents"].append(page.get("documents", []))
+            results["metadatas"].append(page.get("metadatas", []))
+            results["distances"].append([d for d, _ in hits])
+            if "embeddings" in include:
+                results["embeddings"].append(page["embeddings"])
+        return results
+
+    def _result(self, rows: List[int], include) -> Dict[str, Any]:
+        result = {"ids": [self._ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self.vectors[rows].astype(np.float32)
+        return result
+
+
+class LocalVectorClient:
+    """
+    Cliente mínimo estilo Chroma para los backends locales
+    Con `path` cada colección se guarda en path/<nombre> y se reabre al arrancar
+    """
+
+    BACKENDS = {"faiss": FaissCollection, "numpy": NumpyCollection,
+                "quantized": QuantizedCollection, "sharded": ShardedCollection}
+
+    def __init__(self, backend: str, path: Optional[str] = None,
+                 index_params: Dict[str, Dict[str, Any]] = None):
+        """index_params: parámetros por backend (RAGMasterConfig.vector_index_params)"""
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Vector DB no soportada: {backend}")
+        self.backend = backend
+        self.path = path
+        index_params = index_params or {}
+        self.index_params = dict(index_params.get(backend, {}))
+        if backend == "sharded":
+            # Cada shard usa los parámetros de su backend
+            shard_backend = self.index_params.get("shard_backend", "numpy")
+            self.index_params["shard_params"] = index_params.get(shard_backend, {})
+        self._collections: Dict[str, Any] = {}
+
+    def _collection_path(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, name) if self.path else None
+
+    def get_or_create_collection(self, name: str, embedding_function=None, **kwargs):
+        if name not in self._collections:
+            self._collections[name] = self.BACKENDS[self.backend](
+                name, embedding_function, self._collection_path(name), **self.index_params)
+        return self._collections[name]
+
+    def create_collection(self, name: str, embedding_function=None, **kwargs):
+        if name in self._collections or (
+                self.path and os.path.exists(self._collection_path(name))):
+            raise ValueError(f"La colección {name} ya existe")
+        return self.get_or_create_collection(name, embedding_function)
+
+    def delete_collection(self, name: str):
+        collection_path = self._collection_path(name)
+        exists_on_disk = bool(collection_path) and os.path.exists(collection_path)
+        if name not in self._collections and not exists_on_disk:
+            raise ValueError(f"La colección {name} no existe")
+        collection = self._collections.pop(name, None)
+        if hasattr(collection, "close"):
+            collection.close()
+        if exists_on_disk:
+            shutil.rmtree(collection_path)
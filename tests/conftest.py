@@ -0,0 +1,26 @@
+"""
+Configuración común de los tests
+Los módulos viven en src/ (imports planos) y los embeddings usan el backend
+local `hash`, sin red ni API key real
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("EMBEDDING_BACKEND", "hash")
+
+from shared_config import RAGMasterConfig  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Rutas relativas (data/.ingest, data/.cache) dentro de un directorio temporal"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(RAGMasterConfig.embedding_params, "backend", "hash")
+    monkeypatch.setitem(RAGMasterConfig.ingestion_params, "index_batch_size", 5)
+    monkeypatch.setitem(RAGMasterConfig.storage_params, "persist_every_batches", 1)
+    return tmp_path
@@ -0,0 +1,16 @@
+"""Caches del Módulo 2: en memoria por proceso y embeddings persistentes"""
+
+from module_2_optimized import Module2_OptimizedRAG
+
+
+def test_clear_cache_keeps_persistent_embeddings(workdir):
+    rag = Module2_OptimizedRAG()
+    rag.embedding_function(["política de vacaciones", "horario de oficina"])
+    rag.query_cache.put("pregunta", {"answer": "respuesta"})
+
+    rag.clear_cache()
+    assert rag.query_cache.get("pregunta") is None
+    assert len(rag.embedding_cache) == 2
+
+    rag.clear_embedding_cache()
+    assert len(rag.embedding_cache) == 0
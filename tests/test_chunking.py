@@ -0,0 +1,26 @@
+"""Tokenización por párrafos con cache LRU"""
+
+from module_2_optimized import LRUCache, Module2_OptimizedRAG
+
+
+class ByteEncoding:
+    """Encoding mínimo (un token por byte) en lugar de tiktoken, sin red"""
+
+    def encode(self, text):
+        return list(text.encode())
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+
+def test_encode_paragraphs_beyond_cache_capacity(workdir):
+    rag = Module2_OptimizedRAG()
+    rag._encoding = ByteEncoding()
+    rag.token_cache = LRUCache(capacity=3)
+    paragraphs = [f"Párrafo {i}" for i in range(10)] + ["Párrafo 9"]
+
+    tokens = rag.encode_paragraphs(paragraphs)
+
+    assert tokens == [list(p.encode()) for p in paragraphs]
+    # Segunda pasada: mezcla de aciertos de cache y párrafos desalojados
+    assert rag.encode_paragraphs(paragraphs) == tokens
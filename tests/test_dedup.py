@@ -0,0 +1,33 @@
+"""Deduplicación MinHash/LSH de chunks casi idénticos"""
+
+from module_2_optimized import MinHashDeduplicator, Module2_OptimizedRAG
+
+POLICY = ("Los empleados disponen de 22 días laborables de vacaciones al año, "
+          "que deben solicitarse con dos semanas de antelación a su responsable.")
+OTHER = ("El horario de oficina es flexible entre las 8:00 y las 10:00, con una "
+         "jornada de ocho horas y una pausa para comer de una hora.")
+
+
+def test_near_duplicates_map_to_first_occurrence():
+    texts = [POLICY, OTHER, POLICY.replace("22", "veintidós"), POLICY.upper() + "  "]
+    duplicates = MinHashDeduplicator(threshold=0.8).find_duplicates(texts)
+
+    assert duplicates == {2: 0, 3: 0}
+
+
+def test_deduplicate_chunks_merges_references(workdir):
+    rag = Module2_OptimizedRAG()
+    chunks = [
+        {"text": POLICY, "metadata": {"source": "handbook.pdf"}},
+        {"text": OTHER, "metadata": {"source": "handbook.pdf"}},
+        {"text": POLICY + " ", "metadata": {"source": "faqs.json"}},
+        {"text": " ".join(POLICY.split()), "metadata": {"doc_id": 7}},
+    ]
+
+    kept = rag.deduplicate_chunks(chunks)
+
+    assert [record["text"] for record in kept] == [POLICY, OTHER]
+    assert kept[0]["metadata"] == {"source": "handbook.pdf", "duplicate_count": 2,
+                                   "duplicate_positions": "2,3",
+                                   "duplicate_sources": "7,faqs.json"}
+    assert "duplicate_count" not in kept[1]["metadata"]
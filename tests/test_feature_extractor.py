@@ -0,0 +1,26 @@
+"""Etiquetas de metadatos definidas en configuración"""
+
+from module_2_optimized import FeatureExtractor
+from shared_config import RAGMasterConfig
+
+
+def test_overlapping_tags_all_fire():
+    extractor = FeatureExtractor({"has_numbers": r"\d", "has_amount": r"\d+\s?€"})
+    assert extractor.extract("cuesta 40€") == {"has_numbers": True, "has_amount": True}
+    assert extractor.extract("cuesta 40 dólares") == {"has_numbers": True, "has_amount": False}
+
+
+def test_default_tags():
+    extractor = FeatureExtractor(RAGMasterConfig.ingestion_params["metadata_tags"])
+    assert extractor.extract("La POLÍTICA de beneficios") == {
+        "has_numbers": False, "has_policy": True, "has_benefits": True}
+    assert extractor.extract_many(["", "22 días"]) == [
+        {"has_numbers": False, "has_policy": False, "has_benefits": False},
+        {"has_numbers": True, "has_policy": False, "has_benefits": False}]
+
+
+def test_parallel_extraction_matches_sequential():
+    tags = RAGMasterConfig.ingestion_params["metadata_tags"]
+    texts = [f"Política {i}" if i % 3 else f"beneficios del plan {'x' * i}" for i in range(40)]
+    sequential = FeatureExtractor(tags).extract_many(texts)
+    assert FeatureExtractor(tags, workers=2, min_parallel=10).extract_many(texts) == sequential
@@ -0,0 +1,144 @@
+"""Indexación por lotes: checkpoint de reanudación y embeddings en el pipeline"""
+
+import pytest
+
+from module_1_basics import Module1_BasicRAG
+from shared_config import RAGMasterConfig
+
+CHUNKS = [f"Chunk {i}: política de prueba número {i} con contenido {i * 7}" for i in range(15)]
+
+
+@pytest.fixture
+def durable_numpy(workdir, monkeypatch):
+    monkeypatch.setattr(RAGMasterConfig, "VECTOR_DB", "numpy")
+    monkeypatch.setitem(RAGMasterConfig.storage_params, "persistent", True)
+    monkeypatch.setitem(RAGMasterConfig.storage_params, "persist_directory",
+                        str(workdir / "vectordb"))
+
+
+def crash_on_batch(rag, monkeypatch, batch_number):
+    """Simular un fallo al escribir el lote batch_number"""
+    original = rag._apply_batch
+    calls = []
+
+    def failing(prepared, seen_ids):
+        calls.append(None)
+        if len(calls) == batch_number:
+            raise RuntimeError("fallo simulado")
+        return original(prepared, seen_ids)
+
+    monkeypatch.setattr(rag, "_apply_batch", failing)
+
+
+def test_in_memory_collection_reindexes_everything_after_crash(workdir, monkeypatch):
+    rag = Module1_BasicRAG()
+    crash_on_batch(rag, monkeypatch, 3)
+    with pytest.raises(RuntimeError):
+        rag.index_chunks(CHUNKS)
+
+    # La colección en memoria se recrea: no se puede reanudar desde el chunk 10
+    fresh = Module1_BasicRAG()
+    ids = fresh.index_chunks(CHUNKS)
+
+    assert fresh.collection.count() == len(CHUNKS)
+    assert len(fresh.collection.get(ids=ids, include=[])["ids"]) == len(CHUNKS)
+
+
+def test_durable_collection_resumes_from_checkpoint(durable_numpy, monkeypatch, capsys):
+    rag = Module1_BasicRAG()
+    crash_on_batch(rag, monkeypatch, 3)
+    with pytest.raises(RuntimeError):
+        rag.index_chunks(CHUNKS)
+
+    fresh = Module1_BasicRAG()
+    written = []
+    original = fresh._apply_batch
+    monkeypatch.setattr(fresh, "_apply_batch",
+                        lambda prepared, seen: written.append(prepared["ids"]) or original(prepared, seen))
+    ids = fresh.index_chunks(CHUNKS)
+
+    assert "Reanudando indexación desde el chunk 10" in capsys.readouterr().out
+    assert len(written) == 1
+    assert len(ids) == len(CHUNKS)
+    assert fresh.collection.count() == len(CHUNKS)
+
+
+def test_checkpoint_is_ignored_when_chunks_are_missing(durable_numpy, monkeypatch):
+    rag = Module1_BasicRAG()
+    crash_on_batch(rag, monkeypatch, 3)
+    with pytest.raises(RuntimeError):
+        rag.index_chunks(CHUNKS)
+    rag.collection.delete(ids=rag.collection.get(include=[])["ids"])
+    rag.collection.persist()
+
+    fresh = Module1_BasicRAG()
+    fresh.index_chunks(CHUNKS)
+    assert fresh.collection.count() == len(CHUNKS)
+
+
+def test_batches_are_written_with_precomputed_embeddings(workdir, monkeypatch):
+    monkeypatch.setattr(RAGMasterConfig, "VECTOR_DB", "numpy")
+    rag = Module1_BasicRAG()
+    upserts = []
+    original = rag.collection.upsert
+
+    def spy(**kwargs):
+        upserts.append(kwargs)
+        return original(**kwargs)
+
+    monkeypatch.setattr(rag.collection, "upsert", spy)
+    rag.index_chunks(CHUNKS)
+
+    assert len(upserts) == 3
+    assert all(len(call["embeddings"]) == len(call["ids"]) == 5 for call in upserts)
+    nearest = rag.collection.query(query_embeddings=rag.embedding_function(CHUNKS[:1]),
+                                   n_results=1)
+    assert nearest["ids"][0] == upserts[0]["ids"][:1]
+
+
+def test_pipeline_indexes_through_process_shards(workdir, monkeypatch):
+    monkeypatch.setattr(RAGMasterConfig, "VECTOR_DB", "sharded")
+    monkeypatch.setitem(RAGMasterConfig.vector_index_params["sharded"], "executor", "process")
+    monkeypatch.setitem(RAGMasterConfig.vector_index_params["sharded"], "num_shards", 3)
+    chunks = [f"Chunk {i}: texto de prueba para shards con valor {i * 11}" for i in range(60)]
+
+    rag = Module1_BasicRAG()
+    try:
+        # 12 lotes: el hilo del pipeline consulta la colección mientras se escribe
+        ids = rag.index_chunks(chunks)
+        assert rag.collection.count() == len(chunks)
+        assert sorted(rag.collection.get(ids=ids, include=[])["ids"]) == sorted(ids)
+    finally:
+        rag.collection.close()
+
+
+def test_restart_with_other_dimensions_rebuilds_index(durable_numpy, tmp_path, monkeypatch):
+    document = str(tmp_path / "politicas.txt")
+    with open(document, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(CHUNKS))
+    first = Module1_BasicRAG()
+    assert first.ingest_document(document)["status"] == "new"
+    assert first.ingest_document(document)["status"] == "unchanged"
+
+    monkeypatch.setitem(RAGMasterConfig.embedding_params, "dimensions", 64)
+    restarted = Module1_BasicRAG()
+    assert restarted.ingest_document(document)["status"] == "new"
+    assert restarted.search_many(["política de prueba"], k=2)[0]["documents"]
+
+
+def test_two_stage_rerank_reads_full_vectors_saved_at_index_time(durable_numpy, monkeypatch):
+    monkeypatch.setitem(RAGMasterConfig.embedding_params, "dimensions", 64)
+    monkeypatch.setitem(RAGMasterConfig.embedding_params, "two_stage", True)
+    Module1_BasicRAG().index_chunks(CHUNKS)
+
+    # Réplica nueva y sin cache de embeddings: solo se embebe la query
+    replica = Module1_BasicRAG()
+    replica.embedding_function.cache = None
+    embedded = []
+    original = replica.embedding_function._embed_unique
+    monkeypatch.setattr(replica.embedding_function, "_embed_unique",
+                        lambda texts: embedded.extend(texts) or original(texts))
+    results = replica.search_many([CHUNKS[4]], k=3)[0]
+
+    assert embedded == [CHUNKS[4]]
+    assert results["documents"][0] == CHUNKS[4]
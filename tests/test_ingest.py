@@ -0,0 +1,92 @@
+"""Ingesta incremental: el manifest decide qué documentos se saltan o re-indexan"""
+
+import json
+
+import pytest
+
+from module_1_basics import Module1_BasicRAG
+from shared_config import RAGMasterConfig
+
+
+@pytest.fixture
+def durable(workdir, monkeypatch):
+    monkeypatch.setattr(RAGMasterConfig, "VECTOR_DB", "numpy")
+    monkeypatch.setitem(RAGMasterConfig.storage_params, "persistent", True)
+    monkeypatch.setitem(RAGMasterConfig.storage_params, "persist_directory",
+                        str(workdir / "vectordb"))
+
+
+def write_faqs(path, answers):
+    faqs = [{"id": i, "question": f"Pregunta {i}", "answer": answer}
+            for i, answer in enumerate(answers)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"faqs": faqs}, f, ensure_ascii=False)
+    return str(path)
+
+
+def stored_ids(rag):
+    return set(rag.collection.get(include=[])["ids"])
+
+
+def record_embedded(rag, monkeypatch):
+    """IDs de cada lote escrito que se embebieron (no estaban en la colección)"""
+    embedded = []
+    original = rag._apply_batch
+    monkeypatch.setattr(rag, "_apply_batch", lambda prepared, seen: embedded.append(
+        list(prepared["embeddings"])) or original(prepared, seen))
+    return embedded
+
+
+def test_unchanged_document_is_skipped_after_restart(durable, tmp_path, monkeypatch):
+    faqs = write_faqs(tmp_path / "faqs.json", [f"Respuesta {i}" for i in range(8)])
+    assert Module1_BasicRAG().ingest_document(faqs) == {
+        "source": faqs, "status": "new", "chunks": 8}
+
+    restarted = Module1_BasicRAG()
+    embedded = record_embedded(restarted, monkeypatch)
+    assert restarted.ingest_document(faqs)["status"] == "unchanged"
+    assert embedded == []
+    assert restarted.indexed
+
+
+def test_changed_document_reindexes_and_drops_stale_chunks(durable, tmp_path, monkeypatch):
+    answers = [f"Respuesta {i}" for i in range(8)]
+    faqs = write_faqs(tmp_path / "faqs.json", answers)
+    rag = Module1_BasicRAG()
+    rag.ingest_document(faqs)
+    before = set(rag.manifest.get(faqs)["chunk_ids"])
+
+    write_faqs(tmp_path / "faqs.json", answers[:5] + ["Respuesta nueva"])
+    embedded = record_embedded(rag, monkeypatch)
+    assert rag.ingest_document(faqs) == {"source": faqs, "status": "updated", "chunks": 6}
+
+    after = set(rag.manifest.get(faqs)["chunk_ids"])
+    assert len(after - before) == 1
+    assert stored_ids(rag) == after
+    assert set(rag.lexical_index.search("Pregunta Respuesta", k=20)[0]) == after
+    # Solo se embebe el chunk nuevo; los que no cambiaron solo actualizan metadatos
+    assert [chunk_id for ids in embedded for chunk_id in ids] == list(after - before)
+
+
+def test_missing_chunks_force_reindex(durable, tmp_path):
+    faqs = write_faqs(tmp_path / "faqs.json", [f"Respuesta {i}" for i in range(4)])
+    rag = Module1_BasicRAG()
+    rag.ingest_document(faqs)
+    rag.collection.delete(ids=rag.manifest.get(faqs)["chunk_ids"][:1])
+
+    assert rag.ingest_document(faqs)["status"] == "updated"
+    assert stored_ids(rag) == set(rag.manifest.get(faqs)["chunk_ids"])
+
+
+def test_removing_a_document_keeps_chunks_shared_with_others(durable, tmp_path):
+    first = write_faqs(tmp_path / "a.json", ["Compartida", "Solo en a"])
+    second = write_faqs(tmp_path / "b.json", ["Compartida"])
+    rag = Module1_BasicRAG()
+    rag.ingest_document(first)
+    rag.ingest_document(second)
+    shared = set(rag.manifest.get(second)["chunk_ids"])
+
+    rag.remove_document(first)
+
+    assert rag.manifest.get(first) is None
+    assert stored_ids(rag) == shared
@@ -0,0 +1,53 @@
+"""Índice BM25 y fusión de rankings (RRF)"""
+
+import pytest
+
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+def test_tokenize_keeps_codes_and_amounts():
+    tokens = BM25Index.tokenize("Política T008: OAuth 2.0 cuesta 40€ (e-mail)")
+
+    assert {"politica", "t008", "oauth", "2.0", "40€", "40", "e-mail"} <= set(tokens)
+
+
+def test_search_ranks_by_bm25():
+    index = BM25Index()
+    index.add(["a", "b", "c", "d"], [
+        "vacaciones: 22 días de vacaciones al año",
+        "política de vacaciones y permisos",
+        "horario de oficina flexible",
+        "vacaciones",
+    ])
+
+    ids, scores = index.search("vacaciones", k=10)
+
+    # Sin el término no aparece; a igual frecuencia gana el documento más corto
+    assert set(ids) == {"a", "b", "d"}
+    assert ids[0] == "d"
+    assert scores == sorted(scores, reverse=True)
+    assert index.search("vacaciones", k=2)[0] == ids[:2]
+
+    # El término raro pesa más que el común
+    assert index.search("oficina vacaciones", k=1)[0] == ["c"]
+
+
+def test_removed_documents_are_not_returned():
+    index = BM25Index()
+    index.add(["a", "b", "c"], ["seguro médico", "seguro dental", "seguro de vida"])
+    index.remove(["a", "b"])
+
+    # Los borrados superan a los vivos: el índice se compacta
+    assert index.search("seguro", k=5)[0] == ["c"]
+    assert len(index) == 1
+
+    index.add(["a"], ["seguro médico"])
+    assert sorted(index.search("seguro", k=5)[0]) == ["a", "c"]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+
+    assert [item for item, _ in fused] == ["a", "c", "b", "d"]
+    assert dict(fused)["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert dict(fused)["d"] == pytest.approx(1 / 63)
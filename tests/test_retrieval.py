@@ -0,0 +1,53 @@
+"""Umbral de similitud en la búsqueda vectorial y en el atajo léxico"""
+
+import numpy as np
+import pytest
+
+from module_1_basics import Module1_BasicRAG
+from shared_config import Module, RAGMasterConfig
+
+CHUNKS = [f"Chunk {i}: política de prueba número {i} con contenido {i * 7}" for i in range(15)]
+
+
+@pytest.fixture
+def rag(workdir, monkeypatch):
+    monkeypatch.setitem(RAGMasterConfig.retrieval_params[Module.BASICS], "threshold", 0.99)
+    rag = Module1_BasicRAG()
+    rag.index_chunks(CHUNKS)
+    return rag
+
+
+def test_dense_results_below_threshold_are_dropped(rag):
+    results = rag.search_many([CHUNKS[3]], k=5)[0]
+
+    assert results["documents"] == [CHUNKS[3]]
+    assert results["similarities"][0] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_lexical_fast_path_is_not_cut_by_cosine_threshold(rag):
+    rag.retrieval_mode = "hybrid"
+    results = rag.search_many(["política 3"], k=5)[0]
+
+    # Scores relativos al mejor BM25: sin similitud coseno, no se filtran
+    assert len(results["documents"]) == 5
+    assert results["similarities"] == [None] * 5
+
+
+def test_hybrid_distances_use_stored_vectors(rag, monkeypatch):
+    monkeypatch.setitem(RAGMasterConfig.retrieval_params[Module.BASICS], "threshold", 0)
+    monkeypatch.setitem(RAGMasterConfig.lexical_params, "candidate_factor", 1)
+    rag.retrieval_mode = "hybrid"
+    rag.embedding_function.cache = None
+    embedded = []
+    original = rag.embedding_function._embed_unique
+    monkeypatch.setattr(rag.embedding_function, "_embed_unique",
+                        lambda texts: embedded.extend(texts) or original(texts))
+    query = "contenido de la política número 3"
+    results = rag.search_many([query], k=3)[0]
+
+    # Candidatos que solo aporta BM25: distancia con el vector guardado, sin re-embeber
+    assert embedded == [query]
+    query_vector = np.asarray(rag.embedding_function([query])[0])
+    expected = [float(((np.asarray(rag.embedding_function([document])[0]) - query_vector) ** 2).sum())
+                for document in results["documents"]]
+    assert results["distances"] == pytest.approx(expected, abs=1e-4)
@@ -0,0 +1,143 @@
+"""Backends vectoriales locales con la API de Chroma"""
+
+import numpy as np
+import pytest
+
+from vector_stores import (LocalVectorClient, ShardedCollection, SnapshotCollection,
+                           benchmark_quantization, read_snapshot_manifest, write_snapshot)
+
+
+@pytest.fixture(params=["thread", "process"])
+def sharded(request):
+    collection = ShardedCollection("test", None, num_shards=3, executor=request.param)
+    yield collection
+    collection.close()
+
+
+def test_sharded_error_does_not_leave_stale_replies(sharded):
+    vectors = np.eye(4, dtype=np.float32)
+    sharded.add(ids=["a", "b", "c", "d"], documents=list("abcd"), embeddings=vectors)
+
+    with pytest.raises(KeyError):
+        sharded.update(ids=["nope_a", "nope_b", "nope_c"], metadatas=[{"x": 1}] * 3)
+
+    # Todas las respuestas de la llamada fallida se consumieron
+    assert sharded.count() == 4
+    result = sharded.query(query_embeddings=vectors[:1].tolist(), n_results=1)
+    assert result["ids"] == [["a"]]
+
+
+@pytest.mark.parametrize("backend", ["numpy", "faiss", "quantized", "sharded"])
+def test_local_backends_return_stored_embeddings(backend):
+    collection = LocalVectorClient(backend).get_or_create_collection("test")
+    vectors = np.eye(4, dtype=np.float32)
+    collection.add(ids=["a", "b", "c", "d"], documents=list("abcd"), embeddings=vectors)
+    collection.delete(ids=["b"])
+
+    stored = collection.get(ids=["c", "a"], include=["embeddings"])
+    rows = {"a": 0, "c": 2}
+    assert np.allclose(np.asarray(stored["embeddings"]),
+                       vectors[[rows[chunk_id] for chunk_id in stored["ids"]]])
+
+    result = collection.query(query_embeddings=vectors[3:].tolist(), n_results=2,
+                              include=["documents", "distances", "embeddings"])
+    assert result["ids"][0][0] == "d"
+    assert np.allclose(np.asarray(result["embeddings"][0][0]), vectors[3])
+
+
+def test_sharded_iter_pages_exports_every_row_once(sharded):
+    vectors = np.random.default_rng(0).normal(size=(25, 4)).astype(np.float32)
+    ids = [f"c{i}" for i in range(25)]
+    sharded.add(ids=ids, documents=ids, embeddings=vectors)
+    sharded.delete(ids=["c3"])
+
+    pages = list(sharded.iter_pages(page_size=4, include=["documents", "embeddings"]))
+    exported = [chunk_id for page in pages for chunk_id in page["ids"]]
+
+    assert all(len(page["ids"]) <= 4 for page in pages)
+    assert sorted(exported) == sorted(set(ids) - {"c3"})
+    assert exported == sharded.get(include=[])["ids"]
+    for page in pages:
+        assert np.allclose(page["embeddings"], vectors[[ids.index(i) for i in page["ids"]]],
+                           atol=1e-2)
+
+
+def clustered_vectors(n, dim, seed=0):
+    """Vectores unitarios en grupos (estructura que aprovechan IVF y PQ)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(16, dim))
+    vectors = centers[rng.integers(0, 16, n)] + 0.3 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.mark.parametrize("backend, params", [
+    ("numpy", {"dtype": "float32"}),
+    ("faiss", {"index_type": "flat"}),
+    ("faiss", {"index_type": "ivf", "nlist": 4, "nprobe": 4, "train_factor": 10}),
+    ("faiss", {"index_type": "hnsw", "rebuild_ratio": 0.5}),
+])
+def test_deleted_chunks_are_not_returned(backend, params, tmp_path):
+    vectors = clustered_vectors(200, 16)
+    ids = [f"c{i}" for i in range(200)]
+    client = LocalVectorClient(backend, path=str(tmp_path), index_params={backend: params})
+    collection = client.get_or_create_collection("test")
+    collection.add(ids=ids, documents=ids, embeddings=vectors)
+    deleted = ids[:60:2]
+    collection.delete(ids=deleted)
+    collection.persist()
+
+    # También tras reabrir desde disco
+    for current in (collection, client.get_or_create_collection("test")):
+        assert current.count() == 200 - len(deleted)
+        result = current.query(query_embeddings=vectors[:60].tolist(), n_results=5)
+        for i, found in enumerate(result["ids"]):
+            assert not set(found) & set(deleted)
+            if ids[i] not in deleted:
+                assert found[0] == ids[i]
+
+    # Un ID borrado se puede volver a añadir
+    collection.add(ids=deleted[:1], documents=deleted[:1], embeddings=vectors[:1])
+    assert collection.query(query_embeddings=vectors[:1].tolist(), n_results=1)["ids"] == [["c0"]]
+
+
+def test_pq_recall_after_rescoring():
+    vectors = clustered_vectors(3000, 32)
+    queries = clustered_vectors(50, 32, seed=1)
+
+    report = benchmark_quantization(vectors, queries, k=10, modes=("pq",), pq_m=8)["pq"]
+
+    # 8 bytes por vector frente a 128: el re-scoring recupera el recall perdido
+    assert report["compression"] >= 10
+    assert report["recall"] >= 0.95
+    assert report["recall"] > report["recall_approximate"]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_snapshot_round_trip(tmp_path, dtype):
+    vectors = clustered_vectors(30, 8)
+    ids = [f"c{i}" for i in range(30)]
+    documents = [f"Texto número {i} con acentos: política ñ" for i in range(30)]
+    metadatas = [{"source": "handbook.pdf", "chunk_index": i, "has_numbers": i % 2 == 0}
+                 for i in range(30)]
+    pages = ((ids[s:s + 7], documents[s:s + 7], metadatas[s:s + 7], vectors[s:s + 7])
+             for s in range(0, 30, 7))
+    path = write_snapshot(str(tmp_path / "snap"), pages, 30,
+                          info={"embedding_model": "hash", "dimensions": None}, dtype=dtype)
+
+    manifest = read_snapshot_manifest(path)
+    assert manifest["count"] == 30 and manifest["embedding_model"] == "hash"
+
+    snapshot = SnapshotCollection(path, None)
+    stored = snapshot.get(ids=["c5", "c29"], include=["documents", "metadatas", "embeddings"])
+    assert stored["ids"] == ["c5", "c29"]
+    assert stored["documents"] == [documents[5], documents[29]]
+    assert stored["metadatas"] == [metadatas[5], metadatas[29]]
+    assert np.allclose(stored["embeddings"], vectors[[5, 29]], atol=1e-3)
+    assert snapshot.get(where={"chunk_index": 3}, include=[])["ids"] == ["c3"]
+
+    result = snapshot.query(query_embeddings=vectors[[4, 17]].tolist(), n_results=3)
+    assert [found[0] for found in result["ids"]] == ["c4", "c17"]
+    assert result["distances"][0][0] == pytest.approx(0, abs=1e-3)
+
+    with pytest.raises(PermissionError):
+        snapshot.add(ids=["x"], embeddings=vectors[:1])